@@ -0,0 +1,182 @@
+"""
+Shared fixtures for the benchmark scripts: a synthetic catalog written to a
+scratch directory and a stub Real-Debrid API with configurable latency.
+
+Nothing here touches the real pipeline directories, /tmp caches or debrid
+accounts; every path the addon writes to is redirected into the scratch dir.
+"""
+
+import base64
+import csv
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CSV_FIELDS = ['series_id', 'season', 'episode', 'title', 'thumbnail', 'infoHash',
+              'fileIdx', 'filesize', 'quality', 'filename']
+
+GRANDS_PRIX = ['Australian', 'Chinese', 'Japanese', 'Bahrain', 'Saudi Arabian', 'Miami',
+               'Emilia Romagna', 'Monaco', 'Spanish', 'Canadian', 'Austrian', 'British',
+               'Belgian', 'Hungarian', 'Dutch', 'Italian', 'Azerbaijan', 'Singapore',
+               'United States', 'Mexico City', 'Sao Paulo', 'Las Vegas', 'Qatar', 'Abu Dhabi']
+
+SESSIONS = ['Drivers Press Conference', 'Free Practice One', 'Free Practice Two',
+            'Free Practice Three', 'Sprint Qualifying', 'Sprint', 'Qualifying',
+            'Pre Race Show', 'Race', 'Post Race Show', 'Ted\'s Notebook', 'Highlights']
+
+
+def info_hash(*parts) -> str:
+    return hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def isolate(fa, workdir: str):
+    """Point every file the addon writes at `workdir`."""
+    fa.config.SHARED_CACHE_PATH = os.path.join(workdir, 'cache.sqlite3')
+    fa.config.CATALOG_SNAPSHOT_PATH = os.path.join(workdir, 'catalog.bin')
+    fa.config.PIPELINE_LOCK_PATH = os.path.join(workdir, 'pipeline.lock')
+    fa.config.METRICS_DIR = os.path.join(workdir, 'metrics')
+    fa.config.CONFIG_TOKEN_SECRET = 'benchmark'
+    # Per-request log lines would dominate the timings.
+    fa.logger.setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+
+def write_series_csv(path: str, series_id: str, videos: int, rng: random.Random) -> list:
+    """Write one processed CSV with `videos` rows; returns its (season, episode) slots."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    per_round = len(SESSIONS)
+    slots = []
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for n in range(videos):
+            season, episode = n // per_round + 1, n % per_round + 1
+            gp = GRANDS_PRIX[(season - 1) % len(GRANDS_PRIX)]
+            session = SESSIONS[episode - 1]
+            writer.writerow([
+                series_id, season, episode, f"{session} - {gp} Grand Prix",
+                f"https://example.invalid/thumbs/{gp.replace(' ', '_')}.jpg",
+                info_hash(series_id, season), episode - 1,
+                f"{rng.uniform(0.5, 9.5):.2f}", rng.choice(['FHD', 'UHD', 'SD']),
+                f"{episode:02d}.F1.2026.R{season:02d}.{gp.replace(' ', '.')}.Grand.Prix."
+                f"{session.replace(' ', '.')}.SkyF1HD.1080p.mkv",
+            ])
+            slots.append((season, episode))
+    return slots
+
+
+def build_synthetic_catalog(fa, workdir: str, series: int, videos: int, seed: int = 1) -> dict:
+    """
+    Replace the addon's catalog with `series` synthetic series of `videos`
+    episodes each and load it. Returns series id -> list of (season, episode).
+    """
+    rng = random.Random(seed)
+    template = fa.CATALOG['series'][0]
+    entries = []
+    episodes = {}
+    for i in range(series):
+        series_id = f"hpybench{i:04d}"
+        path = os.path.join(workdir, 'csv', f"{series_id}.csv")
+        episodes[series_id] = write_series_csv(path, series_id, videos, rng)
+        entry = dict(template)
+        entry.update({
+            'id': series_id,
+            'name': f"Bench {rng.choice(['Sky F1', 'F1TV', 'MotoGP', 'WSBK'])} {i}",
+            'videoFile': path,
+            'videos': [],
+        })
+        entries.append(entry)
+    fa.CATALOG['series'][:] = entries
+    fa.load_all_videos()
+    return episodes
+
+
+def rd_config_str(api_key: str = 'benchmark-key') -> str:
+    """Legacy base64 config segment with Real-Debrid enabled, as the configure page builds it."""
+    cfg = {'debrid': {'rd': {'apiKey': api_key}}, 'enableP2P': True}
+    return base64.b64encode(json.dumps(cfg).encode()).decode().rstrip('=')
+
+
+class StubDebrid:
+    """
+    Minimal Real-Debrid API: every hash in `library` is a downloaded torrent,
+    so play requests resolve synchronously through the real code path
+    (library lookup, torrent info, unrestrict). Each call sleeps `latency`.
+    """
+
+    def __init__(self, library, latency: float = 0.05):
+        stub = self
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._torrents = [{'id': h, 'hash': h, 'status': 'downloaded'} for h in sorted(set(library))]
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, body):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _begin(self):
+                with stub._lock:
+                    stub.calls += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+
+            def do_GET(self):
+                self._begin()
+                path = self.path.split('?')[0]
+                if path.endswith('/torrents'):
+                    self._send(stub._torrents)
+                elif '/torrents/info/' in path:
+                    torrent_id = path.rsplit('/', 1)[1]
+                    files = [{'id': i + 1, 'selected': 1, 'path': f"/{i:02d}.mkv"} for i in range(len(SESSIONS))]
+                    self._send({'id': torrent_id, 'status': 'downloaded', 'files': files,
+                                'links': [f"https://stub.invalid/{torrent_id}/{i}" for i in range(len(files))]})
+                else:
+                    self._send({})
+
+            def do_POST(self):
+                self._begin()
+                if 'unrestrict' in self.path:
+                    self._send({'download': 'https://stub.invalid/download.mkv'})
+                elif 'addMagnet' in self.path:
+                    self._send({'id': 'ADDEDTORRENT'})
+                else:
+                    self._send({})
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_port}/rest/1.0"
+
+    def close(self):
+        self._server.shutdown()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Load test for the Stremio endpoints.
+
+Serves the Flask app from a threaded werkzeug server over a synthetic catalog
+and a stub Real-Debrid API, then drives each route with concurrent clients
+and reports p50/p99 latency and throughput per route.
+
+Usage:
+    python benchmarks/load_test.py [--series 20] [--videos 1200] [--clients 16]
+                                   [--requests 2000] [--debrid-latency 0.05]
+                                   [--routes meta,stream,...]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import requests
+from werkzeug.serving import make_server
+
+from common import (build_synthetic_catalog, isolate, percentile, rd_config_str,
+                    StubDebrid)
+
+import formulio_addon as fa
+
+
+def route_urls(episodes: dict, rng: random.Random) -> dict:
+    """route name -> zero-arg function returning the next path to request."""
+    series_ids = list(episodes)
+    cfg = rd_config_str()
+    queries = ['monaco quali', 'race', 'sprint', 'free practice', 'grand prix', 'bench sky', 'zzz']
+
+    def episode():
+        series_id = rng.choice(series_ids)
+        season, number = rng.choice(episodes[series_id])
+        return series_id, season, number
+
+    def play():
+        series_id, season, number = episode()
+        video = fa.get_episode_videos(series_id, season, number)[0]
+        token = fa.config_token('rd', 'benchmark-key')
+        return f"/rd/play/{token}/{video['infoHash']}/{video['fileIdx']}/{urllib.parse.quote(video['filename'])}"
+
+    return {
+        'manifest': lambda: '/manifest.json',
+        'catalog': lambda: '/catalog/series/formulio-series.json',
+        'search': lambda: f"/catalog/series/formulio-series/search={urllib.parse.quote(rng.choice(queries))}.json",
+        'meta': lambda: f"/meta/series/{rng.choice(series_ids)}.json",
+        'stream': lambda: '/stream/series/{}:{}:{}.json'.format(*episode()),
+        'stream_rd': lambda: f"/{cfg}/stream/series/" + '{}:{}:{}.json'.format(*episode()),
+        'play_rd': play,
+    }
+
+
+def run_route(base: str, next_path, clients: int, total: int) -> dict:
+    latencies: list = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = [total]
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                path = next_path()
+            start = time.perf_counter()
+            try:
+                resp = session.get(base + path, allow_redirects=False, timeout=30)
+                ok = resp.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'rps': len(latencies) / wall if wall else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--series', type=int, default=20)
+    parser.add_argument('--videos', type=int, default=1200, help='videos per series')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per route')
+    parser.add_argument('--debrid-latency', type=float, default=0.05, help='stub RD latency (s)')
+    parser.add_argument('--routes', default='', help='comma-separated subset of routes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='formulio-bench-')
+    try:
+        isolate(fa, workdir)
+        os.chdir(workdir)
+        episodes = build_synthetic_catalog(fa, workdir, args.series, args.videos, args.seed)
+        library = [fa.get_episode_videos(s, *slot)[0]['infoHash'] for s in episodes for slot in episodes[s]]
+        stub = StubDebrid(library, latency=args.debrid_latency)
+        fa.config.RD_API_BASE = stub.url
+
+        server = make_server('127.0.0.1', 0, fa.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+
+        routes = route_urls(episodes, random.Random(args.seed))
+        selected = [r for r in args.routes.split(',') if r] or list(routes)
+        print(f"{args.series} series x {args.videos} videos, {args.clients} clients, "
+              f"{args.requests} requests/route, stub RD latency {args.debrid_latency * 1000:.0f}ms")
+        print(f"{'route':<12}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+        for name in selected:
+            result = run_route(base, routes[name], args.clients, args.requests)
+            print(f"{name:<12}{result['requests']:>10}{result['errors']:>8}"
+                  f"{result['p50']:>10.2f}{result['p99']:>10.2f}{result['rps']:>10.0f}")
+        print(f"stub RD calls: {stub.calls}")
+        server.shutdown()
+        stub.close()
+    finally:
+        os.chdir('/')
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
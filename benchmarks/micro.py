@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the hot paths behind the Stremio endpoints and the
+pipeline's merge step: load_videos (cold parse and warm memo hit),
+build_streams_for_video, search_catalog, build_stream_list (cold and cached)
+and 6merger.process_csv.
+
+Usage:
+    python benchmarks/micro.py [--series 20] [--videos 1200] [--rows 5000]
+                               [--repeat 5] [--merger egor/ego]
+"""
+
+import argparse
+import contextlib
+import csv
+import importlib.util
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+from common import (ROOT, GRANDS_PRIX, SESSIONS, build_synthetic_catalog, info_hash,
+                    isolate, rd_config_str)
+
+import formulio_addon as fa
+
+
+def report(name: str, fn, number: int, repeat: int):
+    times = timeit.repeat(fn, number=number, repeat=repeat)
+    best = min(times) / number
+    median = sorted(times)[len(times) // 2] / number
+    unit, scale = ('ms', 1e3) if best >= 1e-3 else ('µs', 1e6)
+    print(f"{name:<34}{best * scale:>10.1f}{median * scale:>10.1f} {unit}   ({number} x {repeat})")
+
+
+def bench_catalog(args, workdir: str):
+    episodes = build_synthetic_catalog(fa, workdir, args.series, args.videos, args.seed)
+    rng = random.Random(args.seed)
+    series_ids = list(episodes)
+    path = fa.get_series(series_ids[0])['videoFile']
+    host = 'http://127.0.0.1:7000/'
+    debrid_cfg = {k: {'apiKey': f'bench-{k}'} for k in ('tb', 'rd', 'ad', 'pm')}
+    cfg_str = rd_config_str()
+
+    def cold_load():
+        fa._csv_files.pop(path, None)
+        fa.load_videos(path)
+
+    def episode():
+        series_id = rng.choice(series_ids)
+        return series_id, rng.choice(episodes[series_id])
+
+    def streams():
+        series_id, (season, number) = episode()
+        series = fa.get_series(series_id)
+        for video in fa.get_episode_videos(series_id, season, number):
+            fa.build_streams_for_video(video, series, season, debrid_cfg, True, host)
+
+    def stream_list_cold():
+        fa.clear_stream_cache()
+        series_id, (season, number) = episode()
+        fa.build_stream_list('series', f"{series_id}:{season}:{number}", cfg_str, host)
+
+    def stream_list_warm():
+        series_id, (season, number) = episode()
+        fa.build_stream_list('series', f"{series_id}:{season}:{number}", cfg_str, host)
+
+    queries = ['monaco quali', 'race', 'bench sky', 'f1tv 1', 'zzz']
+    fa.search_catalog('series', 'warm')  # the index is built lazily on first search
+
+    print(f"catalog: {args.series} series x {args.videos} videos")
+    report(f"load_videos cold ({args.videos} rows)", cold_load, 5, args.repeat)
+    report('load_videos warm (memo hit)', lambda: fa.load_videos(path), 1000, args.repeat)
+    report('build_streams_for_video (4 debrid)', streams, 1000, args.repeat)
+    report('search_catalog', lambda: fa.search_catalog('series', rng.choice(queries)), 1000, args.repeat)
+    report('build_stream_list cold', stream_list_cold, 500, args.repeat)
+    for series_id in series_ids:
+        for season, number in episodes[series_id]:
+            fa.build_stream_list('series', f"{series_id}:{season}:{number}", cfg_str, host)
+    report('build_stream_list cached', stream_list_warm, 5000, args.repeat)
+
+
+def load_merger(directory: str):
+    path = os.path.join(ROOT, directory, '6merger.py')
+    spec = importlib.util.spec_from_file_location('bench_merger', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_content_csv(path: str, rows: int, year: int, rng: random.Random):
+    """Synthetic 5torrenttocontent.py output: several releases per round, shuffled."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Torrent File Name', 'Filename Within Torrent', 'InfoHash',
+                         'File Index', 'Filesize_GB'])
+        for n in range(rows):
+            rnd = n % len(GRANDS_PRIX) + 1
+            gp = GRANDS_PRIX[rnd - 1].replace(' ', '.')
+            release = n // (len(GRANDS_PRIX) * len(SESSIONS))
+            idx = n // len(GRANDS_PRIX) % len(SESSIONS)
+            session = SESSIONS[idx].replace(' ', '.').replace("'", '')
+            torrent = f"F1.{year}.R{rnd:02d}.{gp}.Grand.Prix.SkyF1HD.1080p.v{release}"
+            writer.writerow([
+                torrent,
+                f"{torrent}/{idx + 1:02d}.F1.{year}.R{rnd:02d}.{gp}.Grand.Prix.{session}.SkyF1HD.1080p.mkv",
+                info_hash(torrent), idx, f"{rng.uniform(0.5, 9.5):.2f}",
+            ])
+
+
+def bench_merger(args, workdir: str):
+    merger = load_merger(args.merger)
+    cfg, _raw = merger.load_config()
+    sport = merger.load_sport_config(cfg)
+    input_csv = os.path.join(workdir, 'content.csv')
+    write_content_csv(input_csv, args.rows, cfg.year, random.Random(args.seed))
+    cfg.data_paths = dict(cfg.data_paths, input_csv=input_csv,
+                          output_csv=os.path.join(workdir, '6processed.csv'))
+    cfg.debug = {}
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return merger.process_csv(cfg, sport)
+
+    print(f"merger: {args.merger}/6merger.py, {args.rows} input rows -> {run()} episodes")
+    report('process_csv', run, 3, args.repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--series', type=int, default=20)
+    parser.add_argument('--videos', type=int, default=1200, help='videos per series')
+    parser.add_argument('--rows', type=int, default=5000, help='merger input rows')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--merger', default='egor/ego', help='pipeline directory holding 6merger.py')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='formulio-bench-')
+    try:
+        isolate(fa, workdir)
+        print(f"{'benchmark':<34}{'best':>10}{'median':>10}")
+        bench_catalog(args, workdir)
+        bench_merger(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import csv
+import io
 import logging
 import os
 import subprocess
@@ -12,12 +13,36 @@ import urllib.parse
 import hashlib
 import threading
 import shutil
+import sqlite3
+import re
+import bisect
+import struct
+import hmac
+import secrets
+import functools
 from threading import Thread
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from flask import Flask, jsonify, abort, send_from_directory, request, redirect
+from contextlib import contextmanager
+from collections import OrderedDict
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from flask import Flask, jsonify, abort, send_from_directory, request, redirect, g
 from werkzeug.middleware.proxy_fix import ProxyFix
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from time import time as now
 
+try:
+    import fcntl
+except ImportError:  # no flock: every worker runs its own pipeline
+    fcntl = None
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # CSV watcher falls back to polling
+    Observer = None
+    FileSystemEventHandler = object
+
 
 # ═══════════════════════════════════════════════════════════════════════════
 # Logging
@@ -35,123 +60,798 @@ PYTHON_EXE = sys.executable
 
 
 # ═══════════════════════════════════════════════════════════════════════════
-# TTL caches
+# Config
+# ═══════════════════════════════════════════════════════════════════════════
+
+class Config:
+    SCRIPT_INTERVAL = 909
+    TORBOX_API_BASE = 'https://api.torbox.app'
+    RD_API_BASE = 'https://api.real-debrid.com/rest/1.0'
+    AD_API_BASE = 'https://api.alldebrid.com/v4'
+    AD_API_BASE_V41 = 'https://api.alldebrid.com/v4.1'
+    PM_API_BASE = 'https://www.premiumize.me/api'
+    # Per-provider link cache limits: max entries, TTL for resolved links,
+    # TTL for '__UNAVAILABLE__' (negative) results
+    CACHE_SETTINGS = {
+        provider: {
+            'maxsize': int(os.environ.get(f'{provider.upper()}_CACHE_MAXSIZE', 1000)),
+            'ttl': int(os.environ.get(f'{provider.upper()}_CACHE_TTL', 300)),
+            'negative_ttl': int(os.environ.get(f'{provider.upper()}_CACHE_NEGATIVE_TTL', 60)),
+        }
+        for provider in ('rd', 'ad', 'pm', 'tb')
+    }
+    # Host-wide resolution cache shared by all workers ('sqlite' or 'none')
+    SHARED_CACHE_BACKEND = os.environ.get('SHARED_CACHE_BACKEND', 'sqlite')
+    SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH', '/tmp/formulio_cache.sqlite3')
+    # Upstream HTTP connection pooling (per provider, per worker process)
+    HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 4))
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 32))
+    HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 2))
+    HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.3))
+    # Background magnet add/poll jobs (RD/AD)
+    RESOLVE_WORKERS = int(os.environ.get('RESOLVE_WORKERS', 8))
+    # TTL for the '__PENDING__' marker cached while a job is running
+    RESOLVE_PENDING_TTL = int(os.environ.get('RESOLVE_PENDING_TTL', 10))
+    # Optional operator keys used only to bulk-check upstream cache status of
+    # new releases after a pipeline run. Cache status is provider-wide, not
+    # per account, so any valid key works. Unset = warmup disabled.
+    WARMUP_API_KEYS = {
+        'tb': os.environ.get('TB_WARMUP_API_KEY', ''),
+        'pm': os.environ.get('PM_WARMUP_API_KEY', ''),
+    }
+    WARMUP_BATCH_SIZE = 100
+    # Per-key debrid library indexes: recent-items refresh / full refetch ages
+    LIBRARY_REFRESH_TTL = int(os.environ.get('LIBRARY_REFRESH_TTL', 15))
+    # Refresh interval for providers that can only list the whole library
+    LIBRARY_FULL_REFRESH_TTL = int(os.environ.get('LIBRARY_FULL_REFRESH_TTL', 60))
+    LIBRARY_FULL_TTL = int(os.environ.get('LIBRARY_FULL_TTL', 300))
+    LIBRARY_MAX_KEYS = 500
+    # Built /stream responses kept per (episode, config, host)
+    STREAM_CACHE_MAXSIZE = int(os.environ.get('STREAM_CACHE_MAXSIZE', 5000))
+    # HMAC key for play-URL config tokens, or a file to keep a generated one in
+    # (put it on a persistent volume shared by every host). Tokens end up in
+    # users' installed Stremio streams, so the key must outlive restarts;
+    # with neither set, play URLs keep the legacy base64 config segment.
+    CONFIG_TOKEN_SECRET = os.environ.get('CONFIG_TOKEN_SECRET', '')
+    CONFIG_TOKEN_SECRET_PATH = os.environ.get('CONFIG_TOKEN_SECRET_PATH', '')
+    CONFIG_TOKEN_CACHE_SIZE = int(os.environ.get('CONFIG_TOKEN_CACHE_SIZE', 4096))
+    # CSV watcher: quiet period before a changed file is reloaded, and how
+    # often the stat-based health check / missed-event sweep runs
+    CSV_WATCH_DEBOUNCE = float(os.environ.get('CSV_WATCH_DEBOUNCE', 2.0))
+    CSV_HEALTH_INTERVAL = int(os.environ.get('CSV_HEALTH_INTERVAL', 60))
+    # One worker per host (flock holder) runs the pipeline and publishes the
+    # parsed catalog; the others attach to that snapshot.
+    PIPELINE_LOCK_PATH = os.environ.get('PIPELINE_LOCK_PATH', '/tmp/formulio_pipeline.lock')
+    CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', '/tmp/formulio_catalog.bin')
+    SNAPSHOT_POLL_INTERVAL = 2
+    PIPELINE_LEADER_RETRY = 30
+    # Feed fetchers + pipelines running at once in a pipeline cycle
+    PIPELINE_CONCURRENCY = int(os.environ.get('PIPELINE_CONCURRENCY', 6))
+    # Each worker writes its metrics to METRICS_DIR/<pid>.json; /metrics sums them
+    METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/formulio_metrics')
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+
+
+config = Config()
+
+app = Flask(__name__, static_folder='static')
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+
+
 # ═══════════════════════════════════════════════════════════════════════════
+# Metrics
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Seconds; spans a cached catalog hit up to a 20-minute pipeline stage.
+METRIC_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1200)
+
+
+class Metrics:
+    """
+    Process-local counters and latency histograms.
+
+    Each worker writes its values to METRICS_DIR/<pid>.json (see
+    flush_metrics) and /metrics sums every worker's file, so a scrape sees
+    the whole gunicorn server whichever worker answers it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict = {}     # (name, labels) -> value
+        self._histograms: dict = {}   # (name, labels) -> [per-bucket counts..., +Inf count, sum]
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        slot = bisect.bisect_left(METRIC_BUCKETS, seconds)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(METRIC_BUCKETS) + 1) + [0.0]
+            hist[slot] += 1
+            hist[-1] += seconds
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator form of time()."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, dict(labels), list(hist)] for (name, labels), hist in self._histograms.items()],
+            }
+
+
+metrics = Metrics()
 
-_rd_cache: dict = {}
-_rd_cache_lock = threading.Lock()
 
-_ad_cache: dict = {}
-_ad_cache_lock = threading.Lock()
+# ═══════════════════════════════════════════════════════════════════════════
+# Shared Cache Backend
+# ═══════════════════════════════════════════════════════════════════════════
 
-_pm_cache: dict = {}
-_pm_cache_lock = threading.Lock()
+class SQLiteCacheBackend:
+    """
+    Resolution cache shared by every worker on the host.
 
-_tb_cache: dict = {}
-_tb_cache_lock = threading.Lock()
+    One SQLite file in WAL mode: readers never block the writer, and each
+    thread keeps its own connection. Entries carry their original store time
+    so TTLs are evaluated by the caller exactly as for the in-process tier.
+    """
 
+    def __init__(self, path: str, max_age: int):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS resolution_cache ('
+            ' namespace TEXT NOT NULL, key TEXT NOT NULL,'
+            ' result TEXT NOT NULL, time REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key)) WITHOUT ROWID'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS resolution_leases ('
+            ' key TEXT PRIMARY KEY, owner INTEGER NOT NULL, expires REAL NOT NULL)'
+            ' WITHOUT ROWID'
+        )
 
-def rd_cache_get(cache_key: str):
-    with _rd_cache_lock:
-        entry = _rd_cache.get(cache_key)
-        if not entry:
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str):
+        row = self._conn().execute(
+            'SELECT result, time FROM resolution_cache WHERE namespace = ? AND key = ?',
+            (namespace, key)
+        ).fetchone()
+        if not row:
             return None
-        ttl = 60 if entry['result'] == '__UNAVAILABLE__' else 300
-        if now() - entry['time'] < ttl:
-            return entry['result']
-        del _rd_cache[cache_key]
+        return {'result': row[0], 'time': row[1]}
+
+    def set(self, namespace: str, key: str, entry: dict):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO resolution_cache (namespace, key, result, time) '
+            'VALUES (?, ?, ?, ?)',
+            (namespace, key, entry['result'], entry['time'])
+        )
+        self._writes += 1
+        if self._writes % 500 == 0:
+            conn.execute('DELETE FROM resolution_cache WHERE time < ?', (now() - self.max_age,))
+
+    def acquire_lease(self, key: str, owner: int, ttl: float) -> bool:
+        """Take `key` unless another owner holds an unexpired lease on it."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT owner, expires FROM resolution_leases WHERE key = ?',
+                               (key,)).fetchone()
+            if row and row[0] != owner and row[1] > now():
+                conn.execute('COMMIT')
+                return False
+            conn.execute('INSERT OR REPLACE INTO resolution_leases (key, owner, expires) '
+                         'VALUES (?, ?, ?)', (key, owner, now() + ttl))
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def lease_held(self, key: str) -> bool:
+        row = self._conn().execute('SELECT expires FROM resolution_leases WHERE key = ?',
+                                   (key,)).fetchone()
+        return bool(row) and row[0] > now()
+
+    def release_lease(self, key: str, owner: int):
+        self._conn().execute('DELETE FROM resolution_leases WHERE key = ? AND owner = ?',
+                             (key, owner))
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+_shared_cache_failed = False
+
+
+def get_shared_cache():
+    """Return the configured shared backend, or None when disabled/unavailable."""
+    global _shared_cache, _shared_cache_failed
+    if _shared_cache is not None or _shared_cache_failed:
+        return _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None and not _shared_cache_failed:
+            backend = config.SHARED_CACHE_BACKEND
+            try:
+                if backend == 'sqlite':
+                    max_age = max(c['ttl'] for c in config.CACHE_SETTINGS.values())
+                    _shared_cache = SQLiteCacheBackend(config.SHARED_CACHE_PATH, max_age)
+                elif backend != 'none':
+                    logger.error(f"Unknown SHARED_CACHE_BACKEND '{backend}', using per-process cache only")
+                    _shared_cache_failed = True
+                else:
+                    _shared_cache_failed = True
+            except Exception as e:
+                logger.error(f"Shared cache unavailable ({config.SHARED_CACHE_PATH}): {e}")
+                _shared_cache_failed = True
+    return _shared_cache
+
+
+def shared_cache_get(namespace: str, key: str):
+    """Raw {'result', 'time'} entry from the shared tier; callers apply TTLs."""
+    backend = get_shared_cache()
+    if backend is None:
+        return None
+    try:
+        entry = backend.get(namespace, key)
+    except Exception as e:
+        logger.error(f"Shared cache read error: {e}")
         return None
+    return entry
+
+
+def shared_cache_set(namespace: str, key: str, entry: dict):
+    backend = get_shared_cache()
+    if backend is None:
+        return
+    try:
+        backend.set(namespace, key, entry)
+    except Exception as e:
+        logger.error(f"Shared cache write error: {e}")
+
+
+def shared_lease_acquire(key: str, ttl: float) -> bool:
+    """Host-wide lease on `key` for this worker; always granted without a shared tier."""
+    backend = get_shared_cache()
+    if backend is None:
+        return True
+    try:
+        return backend.acquire_lease(key, os.getpid(), ttl)
+    except Exception as e:
+        logger.error(f"Shared lease error: {e}")
+        return True
+
+
+def shared_lease_held(key: str) -> bool:
+    backend = get_shared_cache()
+    if backend is None:
+        return False
+    try:
+        return backend.lease_held(key)
+    except Exception as e:
+        logger.error(f"Shared lease read error: {e}")
+        return False
+
 
+def shared_lease_release(key: str):
+    backend = get_shared_cache()
+    if backend is None:
+        return
+    try:
+        backend.release_lease(key, os.getpid())
+    except Exception as e:
+        logger.error(f"Shared lease release error: {e}")
 
-def rd_cache_set(cache_key: str, result):
-    with _rd_cache_lock:
-        if len(_rd_cache) > 1000:
-            cutoff = now() - 300
-            for k in [k for k, v in _rd_cache.items() if v['time'] < cutoff]:
-                del _rd_cache[k]
-        _rd_cache[cache_key] = {'result': result, 'time': now()}
 
+# ═══════════════════════════════════════════════════════════════════════════
+# TTL caches
+# ═══════════════════════════════════════════════════════════════════════════
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry TTLs for debrid link resolutions.
+
+    Resolved links live for `ttl` seconds, '__UNAVAILABLE__' results for
+    `negative_ttl` and '__PENDING__' markers (a background job is still
+    resolving the link) for RESOLVE_PENDING_TTL. Once `maxsize` is reached the least recently used entry is
+    dropped, so both get and set are O(1). The per-process OrderedDict is the
+    L1 tier; misses fall through to the host-wide shared cache so workers
+    reuse each other's resolutions.
+    """
 
-def ad_cache_get(cache_key: str):
-    with _ad_cache_lock:
-        entry = _ad_cache.get(cache_key)
-        if not entry:
+    def __init__(self, namespace: str, maxsize: int, ttl: int, negative_ttl: int):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'shared_hits': 0, 'evictions': 0, 'expirations': 0}
+
+    def _fresh(self, entry: dict) -> bool:
+        if entry['result'] == '__UNAVAILABLE__':
+            ttl = self.negative_ttl
+        elif entry['result'] == '__PENDING__':
+            ttl = config.RESOLVE_PENDING_TTL
+        else:
+            ttl = self.ttl
+        return now() - entry['time'] < ttl
+
+    def _store(self, key: str, entry: dict):
+        # Caller holds self._lock
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry:
+                if self._fresh(entry):
+                    self._data.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry['result']
+                del self._data[key]
+                self.stats['expirations'] += 1
+
+        entry = shared_cache_get(self.namespace, key)
+        with self._lock:
+            if not entry or not self._fresh(entry):
+                self.stats['misses'] += 1
+                return None
+            self._store(key, entry)
+            self.stats['shared_hits'] += 1
+        return entry['result']
+
+    def get_shared(self, key: str):
+        """Fresh result from the shared tier only, without counting a lookup."""
+        entry = shared_cache_get(self.namespace, key)
+        if not entry or not self._fresh(entry):
             return None
-        ttl = 60 if entry['result'] == '__UNAVAILABLE__' else 300
-        if now() - entry['time'] < ttl:
-            return entry['result']
-        del _ad_cache[cache_key]
-        return None
+        return entry['result']
+
+    def set(self, key: str, result):
+        entry = {'result': result, 'time': now()}
+        with self._lock:
+            self._store(key, entry)
+        shared_cache_set(self.namespace, key, entry)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _new_link_cache(provider: str) -> TTLCache:
+    return TTLCache(provider, **config.CACHE_SETTINGS[provider])
+
+
+_rd_cache = _new_link_cache('rd')
+_ad_cache = _new_link_cache('ad')
+_pm_cache = _new_link_cache('pm')
+_tb_cache = _new_link_cache('tb')
+
+LINK_CACHES = {'rd': _rd_cache, 'ad': _ad_cache, 'pm': _pm_cache, 'tb': _tb_cache}
+
+
+def play_cache_key(key_hash: str, info_hash: str, file_idx, filename) -> str:
+    return f"{key_hash}:{info_hash}:{file_idx}:{filename or ''}"
+
+
+def cache_stats() -> dict:
+    return {
+        cache.namespace: dict(cache.stats, size=len(cache))
+        for cache in (_rd_cache, _ad_cache, _pm_cache, _tb_cache)
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# HTTP Sessions
+# ═══════════════════════════════════════════════════════════════════════════
+
+HTTP_PROVIDERS = ('tb', 'rd', 'ad', 'pm')
 
+_http_sessions: dict = {}
+_http_sessions_lock = threading.Lock()
 
-def ad_cache_set(cache_key: str, result):
-    with _ad_cache_lock:
-        if len(_ad_cache) > 1000:
-            cutoff = now() - 300
-            for k in [k for k, v in _ad_cache.items() if v['time'] < cutoff]:
-                del _ad_cache[k]
-        _ad_cache[cache_key] = {'result': result, 'time': now()}
 
+# Path segments with no lowercase letters (RD torrent ids) are collapsed so
+# /torrents/info/<id> is one endpoint label, not one per torrent.
+_ID_SEGMENT_RE = re.compile(r'^[^a-z]{6,}$')
 
-def pm_cache_get(cache_key: str):
-    with _pm_cache_lock:
-        entry = _pm_cache.get(cache_key)
-        if not entry:
+
+def _endpoint_label(url: str) -> str:
+    path = urllib.parse.urlsplit(url).path
+    return '/'.join(':id' if _ID_SEGMENT_RE.match(part) else part for part in path.split('/'))
+
+
+class InstrumentedSession(requests.Session):
+    """requests.Session that records per-endpoint latency for one provider."""
+
+    def __init__(self, provider: str):
+        super().__init__()
+        self.provider = provider
+
+    def request(self, method, url, *args, **kwargs):
+        endpoint = _endpoint_label(url)
+        status = 'error'
+        start = time.perf_counter()
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+            status = str(resp.status_code)
+            return resp
+        finally:
+            metrics.observe('formulio_debrid_request_duration_seconds', time.perf_counter() - start,
+                            provider=self.provider, endpoint=endpoint)
+            metrics.inc('formulio_debrid_requests_total',
+                        provider=self.provider, endpoint=endpoint, status=status)
+
+
+def _new_http_session(provider: str) -> requests.Session:
+    # Only connection failures are retried for every method (nothing reached
+    # the server); status-based retries are limited to idempotent requests so
+    # a flaky 5xx never makes us add the same magnet twice.
+    retry = Retry(
+        total=config.HTTP_RETRIES,
+        connect=config.HTTP_RETRIES,
+        read=0,
+        status=config.HTTP_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=config.HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = InstrumentedSession(provider)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Connection'] = 'keep-alive'
+    return session
+
+
+def http_session(provider: str) -> requests.Session:
+    """
+    Keep-alive session for one debrid provider.
+
+    Sessions are keyed by pid as well: this module is imported by the gunicorn
+    master before it forks, and sockets must never be shared across workers.
+    """
+    key = (provider, os.getpid())
+    session = _http_sessions.get(key)
+    if session is None:
+        with _http_sessions_lock:
+            session = _http_sessions.get(key)
+            if session is None:
+                session = _new_http_session(provider)
+                _http_sessions[key] = session
+    return session
+
+
+def http_pool_stats() -> dict:
+    """Per-provider request vs. new-connection counts for this worker."""
+    stats: dict = {}
+    pid = os.getpid()
+    for provider in HTTP_PROVIDERS:
+        session = _http_sessions.get((provider, pid))
+        requests_made = connections = 0
+        if session is not None:
+            adapter = session.get_adapter('https://')
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_made += pool.num_requests
+                connections += pool.num_connections
+        stats[provider] = {
+            'requests': requests_made,
+            'connections': connections,
+            'reused': max(requests_made - connections, 0),
+        }
+    return stats
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Background Resolution Jobs
+# ═══════════════════════════════════════════════════════════════════════════
+
+# (provider, key_hash, info_hash) -> future of an add/poll job whose result
+# has not been written to the link cache yet
+_resolve_jobs: dict = {}
+_resolve_jobs_lock = threading.Lock()
+_resolve_executor = None
+_resolve_executor_pid = None
+
+
+def api_key_hash(api_key: str) -> str:
+    return hashlib.md5(api_key.encode()).hexdigest()[:8]
+
+
+def _get_resolve_executor() -> ThreadPoolExecutor:
+    # Must be called with _resolve_jobs_lock held. A pool inherited across
+    # fork has no live threads, so each worker builds its own.
+    global _resolve_executor, _resolve_executor_pid
+    if _resolve_executor is None or _resolve_executor_pid != os.getpid():
+        _resolve_executor = ThreadPoolExecutor(
+            max_workers=config.RESOLVE_WORKERS, thread_name_prefix='resolve')
+        _resolve_executor_pid = os.getpid()
+        _resolve_jobs.clear()
+    return _resolve_executor
+
+
+def start_resolution_job(provider: str, api_key: str, info_hash: str, file_idx, filename,
+                         fn, *args) -> bool:
+    """
+    Run a slow magnet add/poll flow off the request thread.
+
+    At most one job runs per (provider, key, info_hash); returns False if one
+    is already pending. When the job finishes its result is written to the
+    provider's link cache under the play cache key of the file it resolved,
+    so a retry on any worker picks it up through the shared tier.
+    """
+    key_hash = api_key_hash(api_key)
+    job_key = (provider, key_hash, info_hash.lower())
+    cache_key = play_cache_key(key_hash, info_hash, file_idx, filename)
+    with _resolve_jobs_lock:
+        executor = _get_resolve_executor()
+        if job_key in _resolve_jobs:
+            return False
+        future = executor.submit(fn, *args)
+        _resolve_jobs[job_key] = future
+    future.add_done_callback(
+        lambda f: _finish_resolution_job(provider, job_key, cache_key, f))
+    return True
+
+
+def _finish_resolution_job(provider: str, job_key: tuple, cache_key: str, future):
+    try:
+        url = future.result()
+    except Exception as e:
+        logger.error(f"{provider.upper()} resolution job for {job_key[2][:8]} failed: {e}")
+        url = None
+    # Write before dropping the job so cache_unresolved never sees neither.
+    with _resolve_jobs_lock:
+        LINK_CACHES[provider].set(cache_key, url or '__UNAVAILABLE__')
+        if _resolve_jobs.get(job_key) is future:
+            del _resolve_jobs[job_key]
+    if url:
+        logger.info(f"{provider.upper()} resolved {job_key[2][:8]} in background")
+
+
+def cache_unresolved(provider: str, key_hash: str, info_hash: str, cache_key: str):
+    """
+    Cache that a play resolution found no link: '__PENDING__' while a job for
+    the torrent is still running (its link replaces the marker), otherwise
+    '__UNAVAILABLE__'. Returns the link if a job finished with one meanwhile.
+    """
+    cache = LINK_CACHES[provider]
+    with _resolve_jobs_lock:
+        if (provider, key_hash, info_hash.lower()) in _resolve_jobs:
+            cache.set(cache_key, '__PENDING__')
             return None
-        ttl = 60 if entry['result'] == '__UNAVAILABLE__' else 300
-        if now() - entry['time'] < ttl:
-            return entry['result']
-        del _pm_cache[cache_key]
+        cached = cache.get(cache_key)
+        if cached and cached not in ('__UNAVAILABLE__', '__PENDING__'):
+            return cached
+        cache.set(cache_key, '__UNAVAILABLE__')
         return None
 
 
-def pm_cache_set(cache_key: str, result):
-    with _pm_cache_lock:
-        if len(_pm_cache) > 1000:
-            cutoff = now() - 300
-            for k in [k for k, v in _pm_cache.items() if v['time'] < cutoff]:
-                del _pm_cache[k]
-        _pm_cache[cache_key] = {'result': result, 'time': now()}
+# ═══════════════════════════════════════════════════════════════════════════
+# Single-flight Resolution
+# ═══════════════════════════════════════════════════════════════════════════
+
+# (provider, cache_key) -> {'event', 'result'} for resolutions in progress
+_inflight: dict = {}
+_inflight_lock = threading.Lock()
+_coalesced_counts: dict = {}
+
+SINGLE_FLIGHT_WAIT = 30
+SINGLE_FLIGHT_POLL = 0.25
+
+
+def single_flight(provider: str, cache_key: str, fn, *args, **kwargs):
+    """
+    Call fn once for concurrent requests with the same cache key, host-wide.
+
+    Within a worker, the first caller leads and threads arriving while it is
+    in flight block until it finishes and share its result. The leader also
+    takes a lease on the key in the shared cache tier; if another worker
+    already holds it, the leader polls the provider's link cache for that
+    worker's result instead of calling the debrid itself. fn must therefore
+    write its outcome to the link cache before returning. Without a shared
+    tier only the in-process coalescing applies (the default sync gunicorn
+    config runs one single-threaded worker, where neither ever triggers).
+    """
+    key = (provider, cache_key)
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = {'event': threading.Event(), 'result': None}
+            _inflight[key] = call
+        else:
+            _coalesced_counts[provider] = _coalesced_counts.get(provider, 0) + 1
 
+    if not leader:
+        logger.info(f"{provider.upper()} coalesced onto in-flight resolution for {cache_key.split(':')[1][:8]}")
+        call['event'].wait(SINGLE_FLIGHT_WAIT)
+        return call['result']
 
-def tb_cache_get(cache_key: str):
-    with _tb_cache_lock:
-        entry = _tb_cache.get(cache_key)
-        if not entry:
+    lease_key = f"{provider}:{cache_key}"
+    try:
+        if shared_lease_acquire(lease_key, SINGLE_FLIGHT_WAIT):
+            try:
+                call['result'] = fn(*args, **kwargs)
+            finally:
+                shared_lease_release(lease_key)
+        else:
+            with _inflight_lock:
+                _coalesced_counts[provider] = _coalesced_counts.get(provider, 0) + 1
+            logger.info(f"{provider.upper()} waiting on another worker's resolution for {cache_key.split(':')[1][:8]}")
+            call['result'] = _await_shared_flight(provider, cache_key, lease_key)
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        call['event'].set()
+    return call['result']
+
+
+def _await_shared_flight(provider: str, cache_key: str, lease_key: str):
+    """Poll the shared link cache until the lease holder writes its result."""
+    cache = LINK_CACHES[provider]
+    deadline = now() + SINGLE_FLIGHT_WAIT
+    while True:
+        held = shared_lease_held(lease_key)
+        result = cache.get_shared(cache_key)
+        if result:
+            return None if result in ('__UNAVAILABLE__', '__PENDING__') else result
+        if not held or now() >= deadline:
             return None
-        ttl = 60 if entry['result'] == '__UNAVAILABLE__' else 300
-        if now() - entry['time'] < ttl:
-            return entry['result']
-        del _tb_cache[cache_key]
-        return None
+        time.sleep(SINGLE_FLIGHT_POLL)
 
 
-def tb_cache_set(cache_key: str, result):
-    with _tb_cache_lock:
-        if len(_tb_cache) > 1000:
-            cutoff = now() - 300
-            for k in [k for k, v in _tb_cache.items() if v['time'] < cutoff]:
-                del _tb_cache[k]
-        _tb_cache[cache_key] = {'result': result, 'time': now()}
+def single_flight_stats() -> dict:
+    with _inflight_lock:
+        return {
+            'in_flight': len(_inflight),
+            'coalesced': dict(_coalesced_counts),
+        }
 
 
 # ═══════════════════════════════════════════════════════════════════════════
-# Config
+# Library Index
 # ═══════════════════════════════════════════════════════════════════════════
 
-class Config:
-    SCRIPT_INTERVAL = 909
-    TORBOX_API_BASE = 'https://api.torbox.app'
-    RD_API_BASE = 'https://api.real-debrid.com/rest/1.0'
-    AD_API_BASE = 'https://api.alldebrid.com/v4'
-    AD_API_BASE_V41 = 'https://api.alldebrid.com/v4.1'
-    PM_API_BASE = 'https://www.premiumize.me/api'
-
-
-config = Config()
+class LibraryIndex:
+    """
+    Per-API-key map of info hash -> torrent/magnet entry in a debrid library.
+
+    The first lookup for a key fetches the whole library. Later lookups reuse
+    it, refreshing only the most recently added items (via `fetch_recent`)
+    once `LIBRARY_REFRESH_TTL` passes and refetching everything after
+    `LIBRARY_FULL_TTL`. Providers without a cheap "recent" listing pass no
+    `fetch_recent` and do a full refetch every `LIBRARY_FULL_REFRESH_TTL`
+    instead. Only one lookup per key refreshes per interval, hit or miss;
+    concurrent lookups keep answering from the previous listing. Fetchers
+    return a list of entries, or None on error, in which case the first
+    lookup behaves as a miss exactly like the old per-play listing did.
+    """
 
-app = Flask(__name__, static_folder='static')
-app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+    def __init__(self, provider: str, fetch_full, fetch_recent=None):
+        self.provider = provider
+        self.fetch_full = fetch_full
+        self.fetch_recent = fetch_recent
+        self._keys: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    @staticmethod
+    def _by_hash(items: list) -> dict:
+        return {(i.get('hash') or '').lower(): i for i in items if i.get('hash')}
+
+    def _store(self, key: str, entry: dict):
+        # Caller holds self._lock
+        self._keys[key] = entry
+        self._keys.move_to_end(key)
+        while len(self._keys) > config.LIBRARY_MAX_KEYS:
+            self._keys.popitem(last=False)
+
+    def get(self, api_key: str, info_hash: str):
+        key = self._key(api_key)
+        t = now()
+        refresh_ttl = config.LIBRARY_REFRESH_TTL if self.fetch_recent else config.LIBRARY_FULL_REFRESH_TTL
+        with self._lock:
+            entry = self._keys.get(key)
+            fetch = None
+            if entry is None:
+                pass
+            elif t - entry['full_time'] >= config.LIBRARY_FULL_TTL:
+                fetch = self.fetch_full
+            elif t - entry['time'] >= refresh_ttl:
+                fetch = self.fetch_recent or self.fetch_full
+            if fetch is not None:
+                # Claim this interval's refresh; others keep the old listing
+                self._store(key, dict(entry, time=t, full_time=t if fetch is self.fetch_full else entry['full_time']))
+
+        if entry is None:
+            items = self.fetch_full(api_key)
+            if items is None:
+                return None
+            entry = {'items': self._by_hash(items), 'time': t, 'full_time': t}
+            with self._lock:
+                self._store(key, entry)
+        elif fetch is not None:
+            items = fetch(api_key)
+            if items is not None:
+                fresh = self._by_hash(items)
+                with self._lock:
+                    current = self._keys.get(key, entry)
+                    merged = fresh if fetch is self.fetch_full else {**current['items'], **fresh}
+                    entry = dict(current, items=merged)
+                    self._store(key, entry)
+
+        return entry['items'].get(info_hash.lower())
+
+    def put(self, api_key: str, info_hash: str, item: dict):
+        """Record an item we just added, without waiting for a refresh."""
+        key = self._key(api_key)
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None:
+                items = dict(entry['items'])
+                items[info_hash.lower()] = dict(item, hash=info_hash)
+                self._store(key, dict(entry, items=items))
+
+    def discard(self, api_key: str, info_hash: str):
+        """Forget an entry that turned out to be gone upstream."""
+        key = self._key(api_key)
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is not None and info_hash.lower() in entry['items']:
+                items = dict(entry['items'])
+                del items[info_hash.lower()]
+                self._store(key, dict(entry, items=items))
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -163,7 +863,7 @@ def torbox_create_torrent(api_key: str, info_hash: str):
     headers = {'Authorization': f'Bearer {api_key}'}
     magnet = f"magnet:?xt=urn:btih:{info_hash}"
     try:
-        resp = requests.post(url, headers=headers, data={
+        resp = http_session('tb').post(url, headers=headers, data={
             'magnet': magnet, 'seed': 1, 'allow_zip': 'true', 'as_queued': 'false'
         }, timeout=10)
         resp.raise_for_status()
@@ -176,23 +876,29 @@ def torbox_create_torrent(api_key: str, info_hash: str):
         return None
 
 
-def torbox_find_torrent_by_hash(api_key: str, info_hash: str):
+def _torbox_fetch_library(api_key: str):
     url = f"{config.TORBOX_API_BASE}/v1/api/torrents/mylist"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.get(url, headers=headers, params={'bypass_cache': 'true'}, timeout=8)
+        resp = http_session('tb').get(url, headers=headers, params={'bypass_cache': 'true'}, timeout=8)
         resp.raise_for_status()
         data = resp.json()
-        if data.get('success') and data.get('data'):
-            for torrent in data['data']:
-                if torrent.get('hash', '').lower() == info_hash.lower():
-                    return torrent.get('id')
+        if data.get('success'):
+            return [{'id': t.get('id'), 'hash': t.get('hash')} for t in data.get('data') or []]
         return None
     except Exception as e:
         logger.error(f"TorBox find torrent error: {e}")
         return None
 
 
+_tb_library = LibraryIndex('tb', _torbox_fetch_library)
+
+
+def torbox_find_torrent_by_hash(api_key: str, info_hash: str):
+    torrent = _tb_library.get(api_key, info_hash)
+    return torrent.get('id') if torrent else None
+
+
 def torbox_get_download_link(api_key: str, torrent_id, file_idx=None, user_ip=None):
     url = f"{config.TORBOX_API_BASE}/v1/api/torrents/requestdl"
     params = {
@@ -205,7 +911,7 @@ def torbox_get_download_link(api_key: str, torrent_id, file_idx=None, user_ip=No
     if user_ip:
         params['user_ip'] = user_ip
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_session('tb').get(url, params=params, timeout=10)
         resp.raise_for_status()
         data = resp.json()
         if data.get('success') and data.get('data'):
@@ -220,7 +926,7 @@ def torbox_get_torrent_info(api_key: str, torrent_id):
     url = f"{config.TORBOX_API_BASE}/v1/api/torrents/mylist"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.get(url, headers=headers, params={
+        resp = http_session('tb').get(url, headers=headers, params={
             'id': torrent_id, 'bypass_cache': 'true'
         }, timeout=8)
         resp.raise_for_status()
@@ -233,15 +939,35 @@ def torbox_get_torrent_info(api_key: str, torrent_id):
         return None
 
 
+def torbox_check_cached(api_key: str, info_hashes: list) -> set:
+    """Return the subset of info_hashes TorBox already has cached."""
+    url = f"{config.TORBOX_API_BASE}/v1/api/torrents/checkcached"
+    headers = {'Authorization': f'Bearer {api_key}'}
+    try:
+        resp = http_session('tb').get(url, headers=headers, params={
+            'hash': ','.join(info_hashes), 'format': 'list'
+        }, timeout=15)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get('success') and isinstance(data.get('data'), list):
+            return {(t.get('hash') or '').lower() for t in data['data']} - {''}
+        return set()
+    except Exception as e:
+        logger.error(f"TorBox check cached error: {e}")
+        return set()
+
+
 def torbox_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=None):
     """Full flow: find/create torrent -> get download URL."""
     try:
+        # The library index answers from memory; createtorrent is a
+        # rate-limited write, so it's only called on a miss.
         torrent_id = torbox_find_torrent_by_hash(api_key, info_hash)
         if not torrent_id:
             torrent_id = torbox_create_torrent(api_key, info_hash)
-
-        if not torrent_id:
-            return None
+            if not torrent_id:
+                return None
+            _tb_library.put(api_key, info_hash, {'id': torrent_id})
 
         tb_file_id = 0
         torrent_data = torbox_get_torrent_info(api_key, torrent_id)
@@ -264,7 +990,7 @@ def torbox_validate_key(api_key: str):
     url = f"{config.TORBOX_API_BASE}/v1/api/user/me"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.get(url, headers=headers, timeout=8)
+        resp = http_session('tb').get(url, headers=headers, timeout=8)
         resp.raise_for_status()
         data = resp.json()
         if data.get('success') and data.get('data'):
@@ -284,7 +1010,7 @@ def rd_add_magnet(api_key: str, info_hash: str):
     headers = {'Authorization': f'Bearer {api_key}'}
     magnet = f"magnet:?xt=urn:btih:{info_hash}"
     try:
-        resp = requests.post(url, headers=headers, data={'magnet': magnet}, timeout=15)
+        resp = http_session('rd').post(url, headers=headers, data={'magnet': magnet}, timeout=15)
         resp.raise_for_status()
         return resp.json().get('id')
     except Exception as e:
@@ -293,10 +1019,13 @@ def rd_add_magnet(api_key: str, info_hash: str):
 
 
 def rd_get_torrent_info(api_key: str, torrent_id):
+    """Torrent info dict; {} if RD no longer knows the torrent, None on any other failure."""
     url = f"{config.RD_API_BASE}/torrents/info/{torrent_id}"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = http_session('rd').get(url, headers=headers, timeout=10)
+        if resp.status_code == 404:
+            return {}
         resp.raise_for_status()
         return resp.json()
     except Exception as e:
@@ -308,19 +1037,26 @@ def rd_select_files(api_key: str, torrent_id, file_ids="all") -> bool:
     url = f"{config.RD_API_BASE}/torrents/selectFiles/{torrent_id}"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.post(url, headers=headers, data={'files': file_ids}, timeout=10)
+        resp = http_session('rd').post(url, headers=headers, data={'files': file_ids}, timeout=10)
         return resp.status_code in (200, 202, 204)
     except Exception as e:
         logger.error(f"RD select files error: {e}")
         return False
 
 
+def _rd_select_all(api_key: str, info_hash: str, torrent_id):
+    # Record the new status so the next play doesn't select again from a
+    # cached 'waiting_files_selection' before the index refreshes.
+    if rd_select_files(api_key, torrent_id, 'all'):
+        _rd_library.put(api_key, info_hash, {'id': torrent_id, 'status': 'queued'})
+
+
 def rd_unrestrict_link(api_key: str, link: str, user_ip=None):
     url = f"{config.RD_API_BASE}/unrestrict/link"
     headers = {'Authorization': f'Bearer {api_key}'}
     data = {'link': link, 'remote': 0}
     try:
-        resp = requests.post(url, headers=headers, data=data, timeout=15)
+        resp = http_session('rd').post(url, headers=headers, data=data, timeout=15)
         if resp.status_code == 403:
             logger.error(f"RD unrestrict 403 — link: {link}, response: {resp.text}")
             return None
@@ -331,21 +1067,36 @@ def rd_unrestrict_link(api_key: str, link: str, user_ip=None):
         return None
 
 
-def rd_find_torrent_by_hash(api_key: str, info_hash: str):
+def _rd_fetch_torrents(api_key: str, limit: int):
     url = f"{config.RD_API_BASE}/torrents"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.get(url, headers=headers, params={'limit': 2500}, timeout=10)
+        resp = http_session('rd').get(url, headers=headers, params={'limit': limit}, timeout=10)
+        if resp.status_code == 204:  # empty library
+            return []
         resp.raise_for_status()
-        for torrent in resp.json():
-            if torrent.get('hash', '').lower() == info_hash.lower():
-                return torrent
-        return None
+        return [
+            {'id': t.get('id'), 'hash': t.get('hash'), 'status': t.get('status')}
+            for t in resp.json()
+        ]
     except Exception as e:
         logger.error(f"RD find torrent error: {e}")
         return None
 
 
+# RD lists newest first, so the first page picks up new adds and status
+# changes of in-progress torrents.
+_rd_library = LibraryIndex(
+    'rd',
+    fetch_full=lambda api_key: _rd_fetch_torrents(api_key, 2500),
+    fetch_recent=lambda api_key: _rd_fetch_torrents(api_key, 100),
+)
+
+
+def rd_find_torrent_by_hash(api_key: str, info_hash: str):
+    return _rd_library.get(api_key, info_hash)
+
+
 def rd_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=None):
     try:
         existing = rd_find_torrent_by_hash(api_key, info_hash)
@@ -356,11 +1107,15 @@ def rd_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=
             logger.info(f"RD torrent {info_hash[:8]} found, status={status}")
 
             if status == 'waiting_files_selection':
-                rd_select_files(api_key, torrent_id, 'all')
+                _rd_select_all(api_key, info_hash, torrent_id)
                 return None
             elif status == 'downloaded':
                 info = rd_get_torrent_info(api_key, torrent_id)
+                if info is None:
+                    return None
                 if not info:
+                    # Deleted from the RD library since the index was built.
+                    _rd_library.discard(api_key, info_hash)
                     return None
                 links = info.get('links', [])
                 if not links:
@@ -373,30 +1128,10 @@ def rd_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=
                 logger.warning(f"RD torrent {info_hash[:8]} unusable status={status}")
                 return None
         else:
-            logger.info(f"RD torrent {info_hash[:8]} not in library, adding...")
-            torrent_id = rd_add_magnet(api_key, info_hash)
-            if not torrent_id:
-                return None
-
-            time.sleep(2)
-            info = rd_get_torrent_info(api_key, torrent_id)
-            if info and info.get('status') == 'waiting_files_selection':
-                rd_select_files(api_key, torrent_id, 'all')
-            elif info and info.get('status') == 'downloaded':
-                links = info.get('links', [])
-                if links:
-                    return _rd_pick_and_unrestrict(api_key, info, links, file_idx, filename, user_ip)
-
-            time.sleep(4)
-            info = rd_get_torrent_info(api_key, torrent_id)
-            if info and info.get('status') == 'waiting_files_selection':
-                rd_select_files(api_key, torrent_id, 'all')
-            elif info and info.get('status') == 'downloaded':
-                links = info.get('links', [])
-                if links:
-                    return _rd_pick_and_unrestrict(api_key, info, links, file_idx, filename, user_ip)
-
-            logger.info(f"RD torrent {info_hash[:8]} queued, not ready yet")
+            if start_resolution_job('rd', api_key, info_hash, file_idx, filename,
+                                    _rd_add_and_poll, api_key, info_hash, file_idx,
+                                    filename, user_ip):
+                logger.info(f"RD torrent {info_hash[:8]} not in library, adding in background...")
             return None
 
     except Exception as e:
@@ -404,6 +1139,35 @@ def rd_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=
         return None
 
 
+def _rd_add_and_poll(api_key: str, info_hash: str, file_idx, filename, user_ip=None):
+    """Add a magnet and briefly poll it. Runs as a background resolution job."""
+    torrent_id = rd_add_magnet(api_key, info_hash)
+    if not torrent_id:
+        return None
+    _rd_library.put(api_key, info_hash, {'id': torrent_id, 'status': 'magnet_conversion'})
+
+    time.sleep(2)
+    info = rd_get_torrent_info(api_key, torrent_id)
+    if info and info.get('status') == 'waiting_files_selection':
+        _rd_select_all(api_key, info_hash, torrent_id)
+    elif info and info.get('status') == 'downloaded':
+        links = info.get('links', [])
+        if links:
+            return _rd_pick_and_unrestrict(api_key, info, links, file_idx, filename, user_ip)
+
+    time.sleep(4)
+    info = rd_get_torrent_info(api_key, torrent_id)
+    if info and info.get('status') == 'waiting_files_selection':
+        _rd_select_all(api_key, info_hash, torrent_id)
+    elif info and info.get('status') == 'downloaded':
+        links = info.get('links', [])
+        if links:
+            return _rd_pick_and_unrestrict(api_key, info, links, file_idx, filename, user_ip)
+
+    logger.info(f"RD torrent {info_hash[:8]} queued, not ready yet")
+    return None
+
+
 def _rd_pick_and_unrestrict(api_key: str, info: dict, links: list, file_idx, filename, user_ip):
     files = info.get('files', [])
     selected_files = [f for f in files if f.get('selected') == 1]
@@ -430,7 +1194,7 @@ def rd_validate_key(api_key: str):
     url = f"{config.RD_API_BASE}/user"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.get(url, headers=headers, timeout=8)
+        resp = http_session('rd').get(url, headers=headers, timeout=8)
         if resp.status_code in (401, 403):
             return None
         resp.raise_for_status()
@@ -449,7 +1213,7 @@ def ad_upload_magnet(api_key: str, info_hash: str):
     url = f"{config.AD_API_BASE}/magnet/upload"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.post(url, headers=headers, data={'magnets[]': info_hash}, timeout=15)
+        resp = http_session('ad').post(url, headers=headers, data={'magnets[]': info_hash}, timeout=15)
         resp.raise_for_status()
         data = resp.json()
         if data.get('status') == 'success':
@@ -470,7 +1234,7 @@ def ad_get_magnet_status(api_key: str, magnet_id):
     url = f"{config.AD_API_BASE_V41}/magnet/status"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.post(url, headers=headers, data={'id': magnet_id}, timeout=10)
+        resp = http_session('ad').post(url, headers=headers, data={'id': magnet_id}, timeout=10)
         resp.raise_for_status()
         data = resp.json()
         if data.get('status') == 'success':
@@ -489,32 +1253,47 @@ def ad_get_magnet_status(api_key: str, magnet_id):
         return None
 
 
-def ad_find_magnet_by_hash(api_key: str, info_hash: str):
+def _ad_fetch_magnets(api_key: str):
     url = f"{config.AD_API_BASE_V41}/magnet/status"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.post(url, headers=headers, data={}, timeout=15)
+        resp = http_session('ad').post(url, headers=headers, data={}, timeout=15)
         resp.raise_for_status()
         data = resp.json()
         if data.get('status') == 'success':
             magnets = data.get('data', {}).get('magnets', [])
             if not isinstance(magnets, list):
-                return None
-            target_hash = info_hash.lower()
-            for m in magnets:
-                if (m.get('hash') or '').lower() == target_hash:
-                    return m
+                return []
+            return [
+                {'id': m.get('id'), 'hash': m.get('hash'),
+                 'status': m.get('status'), 'statusCode': m.get('statusCode')}
+                for m in magnets
+            ]
         return None
     except Exception as e:
         logger.error(f"AD find magnet error: {e}")
         return None
 
 
+_ad_library = LibraryIndex('ad', _ad_fetch_magnets)
+
+
+def ad_find_magnet_by_hash(api_key: str, info_hash: str):
+    return _ad_library.get(api_key, info_hash)
+
+
+# AllDebrid error codes meaning the magnet id is gone from the account.
+_AD_MISSING_MAGNET_CODES = ('MAGNET_INVALID_ID', 'MAGNET_NOT_FOUND')
+
+
 def ad_get_magnet_files(api_key: str, magnet_id):
+    """File tree list; [] if AD no longer knows the magnet, None on any other failure."""
     url = f"{config.AD_API_BASE}/magnet/files"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.post(url, headers=headers, data={'id[]': magnet_id}, timeout=15)
+        resp = http_session('ad').post(url, headers=headers, data={'id[]': magnet_id}, timeout=15)
+        if resp.status_code == 404:
+            return []
         resp.raise_for_status()
         data = resp.json()
         if data.get('status') == 'success':
@@ -523,8 +1302,13 @@ def ad_get_magnet_files(api_key: str, magnet_id):
                 m = magnets[0]
                 if 'error' in m:
                     logger.error(f"AD get files error: {m['error']}")
+                    err = m['error']
+                    if isinstance(err, dict) and err.get('code') in _AD_MISSING_MAGNET_CODES:
+                        return []
                     return None
                 return m.get('files', [])
+        elif data.get('error', {}).get('code') in _AD_MISSING_MAGNET_CODES:
+            return []
         return None
     except Exception as e:
         logger.error(f"AD get magnet files error: {e}")
@@ -535,7 +1319,7 @@ def ad_unlock_link(api_key: str, link: str, user_ip=None):
     url = f"{config.AD_API_BASE}/link/unlock"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.post(url, headers=headers, data={'link': link}, timeout=15)
+        resp = http_session('ad').post(url, headers=headers, data={'link': link}, timeout=15)
         resp.raise_for_status()
         data = resp.json()
         if data.get('status') == 'success':
@@ -603,7 +1387,11 @@ def ad_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=
 
             if status_code == 4:
                 files_tree = ad_get_magnet_files(api_key, magnet_id)
+                if files_tree is None:
+                    return None
                 if not files_tree:
+                    # Deleted from the AD account since the index was built.
+                    _ad_library.discard(api_key, info_hash)
                     return None
                 flat = _ad_flatten_files(files_tree)
                 picked = _ad_pick_file(flat, file_idx, filename)
@@ -617,22 +1405,10 @@ def ad_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=
                 logger.warning(f"AD magnet {info_hash[:8]} error status={status} ({status_code})")
                 return None
         else:
-            logger.info(f"AD magnet {info_hash[:8]} not in library, uploading...")
-            magnet_id = ad_upload_magnet(api_key, info_hash)
-            if not magnet_id:
-                return None
-
-            time.sleep(2)
-            info = ad_get_magnet_status(api_key, magnet_id)
-            if info and info.get('statusCode') == 4:
-                files_tree = ad_get_magnet_files(api_key, magnet_id)
-                if files_tree:
-                    flat = _ad_flatten_files(files_tree)
-                    picked = _ad_pick_file(flat, file_idx, filename)
-                    if picked:
-                        return ad_unlock_link(api_key, picked['link'], user_ip=user_ip)
-
-            logger.info(f"AD magnet {info_hash[:8]} uploaded and queued")
+            if start_resolution_job('ad', api_key, info_hash, file_idx, filename,
+                                    _ad_upload_and_poll, api_key, info_hash, file_idx,
+                                    filename, user_ip):
+                logger.info(f"AD magnet {info_hash[:8]} not in library, uploading in background...")
             return None
 
     except Exception as e:
@@ -640,11 +1416,32 @@ def ad_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=
         return None
 
 
+def _ad_upload_and_poll(api_key: str, info_hash: str, file_idx, filename, user_ip=None):
+    """Upload a magnet and briefly poll it. Runs as a background resolution job."""
+    magnet_id = ad_upload_magnet(api_key, info_hash)
+    if not magnet_id:
+        return None
+    _ad_library.put(api_key, info_hash, {'id': magnet_id, 'status': 'In Queue', 'statusCode': 0})
+
+    time.sleep(2)
+    info = ad_get_magnet_status(api_key, magnet_id)
+    if info and info.get('statusCode') == 4:
+        files_tree = ad_get_magnet_files(api_key, magnet_id)
+        if files_tree:
+            flat = _ad_flatten_files(files_tree)
+            picked = _ad_pick_file(flat, file_idx, filename)
+            if picked:
+                return ad_unlock_link(api_key, picked['link'], user_ip=user_ip)
+
+    logger.info(f"AD magnet {info_hash[:8]} uploaded and queued")
+    return None
+
+
 def ad_validate_key(api_key: str):
     url = f"{config.AD_API_BASE}/user"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.get(url, headers=headers, timeout=8)
+        resp = http_session('ad').get(url, headers=headers, timeout=8)
         resp.raise_for_status()
         data = resp.json()
         if data.get('status') == 'success':
@@ -691,7 +1488,7 @@ def pm_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=
     headers = {'Authorization': f'Bearer {api_key}'}
     magnet = f"magnet:?xt=urn:btih:{info_hash}"
     try:
-        resp = requests.post(url, headers=headers, data={'src': magnet}, timeout=20)
+        resp = http_session('pm').post(url, headers=headers, data={'src': magnet}, timeout=20)
         resp.raise_for_status()
         data = resp.json()
         if data.get('status') != 'success':
@@ -710,11 +1507,30 @@ def pm_get_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=
         return None
 
 
+def pm_check_cache(api_key: str, info_hashes: list) -> set:
+    """Return the subset of info_hashes Premiumize already has cached."""
+    url = f"{config.PM_API_BASE}/cache/check"
+    headers = {'Authorization': f'Bearer {api_key}'}
+    try:
+        resp = http_session('pm').post(url, headers=headers, data={
+            'items[]': info_hashes
+        }, timeout=15)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get('status') != 'success':
+            return set()
+        flags = data.get('response', [])
+        return {h.lower() for h, cached in zip(info_hashes, flags) if cached}
+    except Exception as e:
+        logger.error(f"PM cache check error: {e}")
+        return set()
+
+
 def pm_validate_key(api_key: str):
     url = f"{config.PM_API_BASE}/account/info"
     headers = {'Authorization': f'Bearer {api_key}'}
     try:
-        resp = requests.get(url, headers=headers, timeout=8)
+        resp = http_session('pm').get(url, headers=headers, timeout=8)
         resp.raise_for_status()
         data = resp.json()
         if data.get('status') == 'success':
@@ -725,6 +1541,56 @@ def pm_validate_key(api_key: str):
         return None
 
 
+# ═══════════════════════════════════════════════════════════════════════════
+# Debrid Availability Warmup
+# ═══════════════════════════════════════════════════════════════════════════
+
+# provider -> set of lowercase info hashes known to be cached upstream.
+# Real-Debrid and AllDebrid have retired their instant-availability
+# endpoints, so only TorBox and Premiumize can be checked in bulk.
+_upstream_cached: dict = {'tb': set(), 'pm': set()}
+_upstream_cached_lock = threading.Lock()
+
+_AVAILABILITY_CHECKERS = {
+    'tb': torbox_check_cached,
+    'pm': pm_check_cache,
+}
+
+
+def is_upstream_cached(provider: str, info_hash: str) -> bool:
+    return info_hash.lower() in _upstream_cached.get(provider, ())
+
+
+def warmup_debrid_availability(info_hashes) -> dict:
+    """
+    Bulk-check new info hashes against each provider with a warmup key.
+
+    Runs after a pipeline run adds episodes so the first viewer doesn't pay
+    for discovering what's already cached. Returns provider -> cached count.
+    """
+    hashes = sorted({h.lower() for h in info_hashes if h})
+    results: dict = {}
+    if not hashes:
+        return results
+    for provider, checker in _AVAILABILITY_CHECKERS.items():
+        api_key = config.WARMUP_API_KEYS.get(provider)
+        if not api_key:
+            continue
+        cached: set = set()
+        for i in range(0, len(hashes), config.WARMUP_BATCH_SIZE):
+            cached |= checker(api_key, hashes[i:i + config.WARMUP_BATCH_SIZE])
+        with _upstream_cached_lock:
+            # Replace rather than mutate: readers iterate without the lock
+            _upstream_cached[provider] = (_upstream_cached[provider] | cached) - (set(hashes) - cached)
+        results[provider] = len(cached)
+        logger.info(f"Warmup {provider.upper()}: {len(cached)}/{len(hashes)} new hashes cached upstream")
+    if results:
+        # Built stream lists carry the "Cached" marker and provider order
+        clear_stream_cache()
+        publish_catalog_snapshot()
+    return results
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 # Config Parsing & User IP
 # ═══════════════════════════════════════════════════════════════════════════
@@ -747,21 +1613,122 @@ def parse_config(config_str: str) -> dict:
         return {'debrid': {}, 'enableP2P': True}
 
 
-def get_user_ip() -> str:
-    return request.remote_addr
+# When a token secret is configured, play URLs carry a signed per-provider
+# token instead of the full base64 config: "c1.<base64url api key>.<truncated
+# HMAC>". Legacy base64 JSON config strings are always accepted.
+CONFIG_TOKEN_VERSION = 'c1'
+CONFIG_TOKEN_SIG_BYTES = 12
 
+_token_secret = None
+_token_secret_lock = threading.Lock()
 
-# ═══════════════════════════════════════════════════════════════════════════
-# Manifest & Catalog Data
-# ═══════════════════════════════════════════════════════════════════════════
 
-MANIFEST = {
-    'id': 'org.stremio.formulio',
-    'version': '3.0.1',
-    'name': 'Formulio',
-    'description': (
-        'An Addon for Motor Racing Replay Content with Debrid support. '
-        '(This addon only displays content from external sources. '
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64url_decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def tokens_enabled() -> bool:
+    return bool(config.CONFIG_TOKEN_SECRET or config.CONFIG_TOKEN_SECRET_PATH)
+
+
+def _load_token_secret() -> bytes:
+    if config.CONFIG_TOKEN_SECRET:
+        return config.CONFIG_TOKEN_SECRET.encode('utf-8')
+    path = config.CONFIG_TOKEN_SECRET_PATH
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    # Write then hard-link so concurrent workers never read a partial file;
+    # whichever link lands first is the secret everyone uses.
+    tmp = f"{path}.{os.getpid()}"
+    fd = os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(secrets.token_bytes(32))
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def token_secret() -> bytes:
+    global _token_secret
+    if _token_secret is None:
+        with _token_secret_lock:
+            if _token_secret is None:
+                _token_secret = _load_token_secret()
+    return _token_secret
+
+
+def _token_signature(provider: str, api_key: str) -> str:
+    message = f"{CONFIG_TOKEN_VERSION}:{provider}:{api_key}".encode('utf-8')
+    digest = hmac.new(token_secret(), message, hashlib.sha256).digest()
+    return _b64url(digest[:CONFIG_TOKEN_SIG_BYTES])
+
+
+@functools.lru_cache(maxsize=256)
+def config_token(provider: str, api_key: str) -> str:
+    """
+    Config segment for `provider`'s play URLs, carrying only its API key: a
+    signed token when a secret is configured, otherwise a legacy base64
+    config that any host or restart can still read.
+    """
+    if not tokens_enabled():
+        legacy = json.dumps({'debrid': {provider: {'apiKey': api_key}}})
+        return base64.b64encode(legacy.encode('utf-8')).decode('utf-8').rstrip('=')
+    payload = _b64url(api_key.encode('utf-8'))
+    return f"{CONFIG_TOKEN_VERSION}.{payload}.{_token_signature(provider, api_key)}"
+
+
+@functools.lru_cache(maxsize=config.CONFIG_TOKEN_CACHE_SIZE)
+def play_api_key(provider: str, config_str: str) -> str:
+    """
+    API key for `provider` from a play URL's config segment, or ''.
+
+    Accepts config tokens and legacy base64 JSON configs. Memoized, so
+    repeat hits on the same URL skip decoding and signature checks.
+    """
+    if config_str.startswith(CONFIG_TOKEN_VERSION + '.'):
+        if not tokens_enabled():
+            logger.warning(f"{provider.upper()} config token received but no token secret is configured")
+            return ''
+        try:
+            _, payload, signature = config_str.split('.')
+            api_key = _b64url_decode(payload).decode('utf-8')
+        except ValueError as e:
+            logger.error(f"Config token parse error: {e}")
+            return ''
+        if not hmac.compare_digest(signature, _token_signature(provider, api_key)):
+            logger.warning(f"{provider.upper()} config token signature mismatch")
+            return ''
+        return api_key
+    return parse_config(config_str).get('debrid', {}).get(provider, {}).get('apiKey', '')
+
+
+def get_user_ip() -> str:
+    return request.remote_addr
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Manifest & Catalog Data
+# ═══════════════════════════════════════════════════════════════════════════
+
+MANIFEST = {
+    'id': 'org.stremio.formulio',
+    'version': '3.0.1',
+    'name': 'Formulio',
+    'description': (
+        'An Addon for Motor Racing Replay Content with Debrid support. '
+        '(This addon only displays content from external sources. '
         'Users are responsible for complying with all applicable laws in their jurisdiction)'
     ),
     'logo': 'https://i.postimg.cc/5tTmz4jb/formulio1.png',
@@ -970,6 +1937,14 @@ CATALOG = {
     ]
 }
 
+MANIFEST_GENRES = frozenset(
+    option
+    for catalog in MANIFEST['catalogs']
+    for extra in catalog.get('extra', [])
+    if extra['name'] == 'genre'
+    for option in extra.get('options', [])
+)
+
 OPTIONAL_META = [
     "posterShape", "background", "logo", "videos", "description",
     "releaseInfo", "imdbRating", "director", "cast", "dvdRelease",
@@ -982,6 +1957,11 @@ OPTIONAL_META = [
 # Video / CSV Loading
 # ═══════════════════════════════════════════════════════════════════════════
 
+CATALOG_CACHE_CONTROL = 'max-age=3600, stale-while-revalidate=1800'
+META_CACHE_CONTROL = 'public, max-age=300'
+STREAM_CACHE_CONTROL = 'no-store, no-cache, must-revalidate, max-age=0'
+
+
 def respond_with(data: dict):
     resp = jsonify(data)
     resp.headers['Access-Control-Allow-Origin'] = '*'
@@ -989,14 +1969,60 @@ def respond_with(data: dict):
 
     # Cache Control Headers to fix Nuvio's caching lag
     # max-age=3600 (1 hour cache), stale-while-revalidate=1800 (allows 30 mins background refreshing)
-    resp.headers['Cache-Control'] = 'max-age=3600, stale-while-revalidate=1800'
+    resp.headers['Cache-Control'] = CATALOG_CACHE_CONTROL
     return resp
 
 
+# normalized path -> {'stat': (mtime_ns, size), 'digest': sha1, 'videos': list}
+_csv_files: dict = {}
+_csv_files_lock = threading.Lock()
+
+
 def load_videos(filepath: str) -> list:
     """
     Load videos from a processed CSV.
 
+    Memoized per file: while (mtime, size) is unchanged the file isn't read
+    at all, and a rewrite with identical content (same sha1) isn't re-parsed.
+    Callers get the same list object back and must not mutate it.
+    """
+    key = os.path.normpath(filepath)
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        logger.warning(f"CSV not found: {filepath}")
+        return []
+    stat_sig = (st.st_mtime_ns, st.st_size)
+
+    with _csv_files_lock:
+        entry = _csv_files.get(key)
+    if entry and entry['stat'] == stat_sig:
+        return entry['videos']
+
+    try:
+        with open(filepath, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        logger.warning(f"CSV not found: {filepath}")
+        return []
+    except Exception as e:
+        logger.error(f"Unexpected error reading {filepath}: {e}")
+        return []
+
+    digest = hashlib.sha1(data).hexdigest()
+    if entry and entry['digest'] == digest:
+        videos = entry['videos']
+    else:
+        videos = _parse_videos(data, filepath)
+    with _csv_files_lock:
+        _csv_files[key] = {'stat': stat_sig, 'digest': digest, 'videos': videos}
+    return videos
+
+
+def _parse_videos(data: bytes, filepath: str) -> list:
+    """
+    Parse processed-CSV bytes into video dicts sorted by (season, episode).
+
     Defensive guarantee: each (season, episode) slot is unique. If a malformed
     CSV (e.g. a partial write, or a merger regression) contains two rows with
     the same (season, episode), the FIRST one wins and the duplicate is logged
@@ -1009,7 +2035,7 @@ def load_videos(filepath: str) -> list:
     duplicate_slots = 0
 
     try:
-        with open(filepath, 'r', newline='') as f:
+        with io.TextIOWrapper(io.BytesIO(data), newline='') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 try:
@@ -1060,8 +2086,6 @@ def load_videos(filepath: str) -> list:
                 f"{filepath}: dropped {duplicate_slots} duplicate "
                 f"(season, episode) row(s) during load"
             )
-    except FileNotFoundError:
-        logger.warning(f"CSV not found: {filepath}")
     except (ValueError, KeyError) as e:
         logger.error(f"Error parsing {filepath}: {e}")
     except Exception as e:
@@ -1069,26 +2093,269 @@ def load_videos(filepath: str) -> list:
     return videos
 
 
-def load_all_videos():
-    """Atomically reload videos. Never replaces a populated list with an empty
-    one (prevents Stremio caching a 'movie-like' meta with zero videos)."""
-    for series in CATALOG['series']:
-        video_file = series.get('videoFile')
-        if not video_file:
-            continue
-        new_videos = load_videos(video_file)
-        if new_videos:
-            series['videos'] = new_videos
-            logger.info(f"Loaded {len(new_videos)} videos for '{series['name']}' from {video_file}")
+# ═══════════════════════════════════════════════════════════════════════════
+# Search Index
+# ═══════════════════════════════════════════════════════════════════════════
+
+_SEARCH_TOKEN_RE = re.compile(r'\w+')
+SEARCH_NGRAM = 3
+
+# Per-field weight of a token hit, and how much of it survives when a query
+# term only matches a token by prefix or as an infix.
+SEARCH_FIELD_WEIGHTS = {'name': 3.0, 'title': 2.0, 'description': 1.0}
+SEARCH_EXACT, SEARCH_PREFIX, SEARCH_INFIX = 1.0, 0.75, 0.5
+
+
+def search_tokens(text) -> list:
+    return _SEARCH_TOKEN_RE.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    """
+    Inverted index over series names, descriptions and episode titles.
+
+    Built on the first search after each catalog swap, so a reload or
+    snapshot attach doesn't pay for it up front. Each query term is matched
+    against the token vocabulary exactly, by prefix (bisect over the sorted
+    vocabulary) and as an infix: via a trigram index for terms of
+    SEARCH_NGRAM+ characters, by scanning the vocabulary for shorter ones.
+    A series must match every term; results are ranked by summed weight,
+    ties keeping catalog order. A query with no word characters falls back
+    to the plain substring scan (an empty query lists everything).
+    """
+
+    def __init__(self, items):
+        self._items = list(items)
+        self._built = False
+        self._lock = threading.Lock()
+
+    def _build(self):
+        postings: dict = {}
+        for pos, item in enumerate(self._items):
+            fields = [(item.get('name'), SEARCH_FIELD_WEIGHTS['name']),
+                      (item.get('description'), SEARCH_FIELD_WEIGHTS['description'])]
+            fields += [(v.get('title'), SEARCH_FIELD_WEIGHTS['title']) for v in item.get('videos') or []]
+            for text, weight in fields:
+                for token in search_tokens(text):
+                    hits = postings.setdefault(token, {})
+                    if hits.get(pos, 0) < weight:
+                        hits[pos] = weight
+        self._postings = postings
+        self._vocab = sorted(postings)
+        grams: dict = {}
+        for token in self._vocab:
+            for i in range(len(token) - SEARCH_NGRAM + 1):
+                grams.setdefault(token[i:i + SEARCH_NGRAM], set()).add(token)
+        self._grams = grams
+        self._built = True
+
+    def _expand(self, term: str) -> dict:
+        """Vocabulary tokens matching one query term -> match factor."""
+        matches = {}
+        start = bisect.bisect_left(self._vocab, term)
+        for token in self._vocab[start:]:
+            if not token.startswith(term):
+                break
+            matches[token] = SEARCH_EXACT if token == term else SEARCH_PREFIX
+        if len(term) >= SEARCH_NGRAM:
+            candidates = None
+            for i in range(len(term) - SEARCH_NGRAM + 1):
+                tokens = self._grams.get(term[i:i + SEARCH_NGRAM])
+                if not tokens:
+                    candidates = None
+                    break
+                candidates = tokens if candidates is None else candidates & tokens
         else:
-            existing = series.get('videos') or []
-            if existing:
-                logger.warning(
-                    f"Reload for '{series['name']}' returned 0 videos — "
-                    f"KEEPING previous {len(existing)} videos (file: {video_file})"
-                )
+            # Too short for a trigram ("f1" in "skyf1hd")
+            candidates = self._vocab
+        for token in candidates or ():
+            if token not in matches and term in token:
+                matches[token] = SEARCH_INFIX
+        return matches
+
+    def _scan(self, query: str) -> list:
+        query = query.lower()
+        return [item for item in self._items
+                if query in item['name'].lower()
+                or (item.get('description') and query in item['description'].lower())
+                or any(query in v.get('title', '').lower() for v in item.get('videos') or [])]
+
+    def search(self, query: str) -> list:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._build()
+        terms = search_tokens(query)
+        if not terms:
+            return self._scan(query)
+        scores = None
+        for term in dict.fromkeys(terms):
+            term_scores: dict = {}
+            for token, factor in self._expand(term).items():
+                for pos, weight in self._postings[token].items():
+                    score = weight * factor
+                    if score > term_scores.get(pos, 0):
+                        term_scores[pos] = score
+            if scores is None:
+                scores = term_scores
             else:
-                logger.warning(f"No videos for '{series['name']}' and none cached ({video_file})")
+                scores = {pos: scores[pos] + score for pos, score in term_scores.items() if pos in scores}
+            if not scores:
+                return []
+        if not scores:
+            return []
+        return [self._items[pos] for pos in sorted(scores, key=lambda pos: (-scores[pos], pos))]
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Catalog Index
+# ═══════════════════════════════════════════════════════════════════════════
+
+_EMPTY_INDEX = MappingProxyType({})
+
+def _build_catalog_index(series_list: list):
+    """Build series-id -> series, series-id -> {(season, episode): videos} and
+    the per-type search index."""
+    by_id: dict = {}
+    episodes: dict = {}
+    for series in series_list:
+        by_id[series['id']] = series
+        slots: dict = {}
+        for video in series.get('videos') or []:
+            slot = (video['season'], video['episode'])
+            slots[slot] = slots.get(slot, ()) + (video,)
+        episodes[series['id']] = MappingProxyType(slots)
+    return MappingProxyType({
+        'series': MappingProxyType(by_id),
+        'episodes': MappingProxyType(episodes),
+        'search': MappingProxyType({'series': SearchIndex(series_list)}),
+    })
+
+
+# Read-only lookup tables rebuilt by load_all_videos(). Handlers read the
+# module-level reference once per lookup, so a reload swapping it mid-request
+# never exposes a half-built index.
+_catalog_index = _build_catalog_index(CATALOG['series'])
+
+# Bumped on every load_all_videos(); anything derived from CATALOG is only
+# valid for the generation it was built from.
+_catalog_generation = 0
+
+# Held across updating CATALOG, rebuilding the index and bumping the
+# generation: pipeline stages, the CSV watcher and snapshot loads reload
+# concurrently, and an index built from older state must never be swapped
+# in after a newer one.
+_catalog_reload_lock = threading.Lock()
+
+
+def get_series(series_id: str):
+    return _catalog_index['series'].get(series_id)
+
+
+def get_episode_videos(series_id: str, season: int, episode: int) -> tuple:
+    return _catalog_index['episodes'].get(series_id, _EMPTY_INDEX).get((season, episode), ())
+
+
+@metrics.timed('formulio_catalog_reload_duration_seconds', source='csv')
+def load_all_videos(paths=None) -> bool:
+    """Atomically reload videos. Never replaces a populated list with an empty
+    one (prevents Stremio caching a 'movie-like' meta with zero videos).
+
+    Incremental: only series whose CSV actually changed (see load_videos) are
+    swapped in, and the index, generation and response caches are left alone
+    when nothing did. `paths` restricts the check to those CSVs. Returns
+    whether anything changed."""
+    targets = {os.path.normpath(p) for p in paths} if paths is not None else None
+    changed = False
+    with _catalog_reload_lock:
+        for series in CATALOG['series']:
+            video_file = series.get('videoFile')
+            if not video_file:
+                continue
+            if targets is not None and os.path.normpath(video_file) not in targets:
+                continue
+            new_videos = load_videos(video_file)
+            if new_videos:
+                if new_videos is series.get('videos'):
+                    continue
+                series['videos'] = new_videos
+                changed = True
+                logger.info(f"Loaded {len(new_videos)} videos for '{series['name']}' from {video_file}")
+            else:
+                existing = series.get('videos') or []
+                if existing:
+                    logger.warning(
+                        f"Reload for '{series['name']}' returned 0 videos — "
+                        f"KEEPING previous {len(existing)} videos (file: {video_file})"
+                    )
+                else:
+                    logger.warning(f"No videos for '{series['name']}' and none cached ({video_file})")
+
+        if not changed:
+            return False
+        _swap_catalog_index()
+    publish_catalog_snapshot()
+    return True
+
+
+def _swap_catalog_index():
+    """Caller holds _catalog_reload_lock."""
+    global _catalog_index, _catalog_generation
+    _catalog_index = _build_catalog_index(CATALOG['series'])
+    _catalog_generation += 1
+    clear_response_cache()
+    clear_stream_cache()
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Response Cache
+# ═══════════════════════════════════════════════════════════════════════════
+
+_response_cache: dict = {}
+_response_cache_lock = threading.Lock()
+
+
+def clear_response_cache():
+    with _response_cache_lock:
+        _response_cache.clear()
+
+
+def render_json(data) -> bytes:
+    """The bytes jsonify() would send, without needing a request context."""
+    return (app.json.dumps(data, indent=None, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def render_cached(cache_key: str, build) -> dict:
+    """
+    Return {'body', 'etag'} for a JSON body rendered once per catalog generation.
+
+    `build` is only called on a miss. The ETag is a hash of the rendered bytes,
+    so it survives reloads that don't change the content.
+    """
+    generation = _catalog_generation
+    with _response_cache_lock:
+        entry = _response_cache.get(cache_key)
+    if not entry or entry['generation'] != generation:
+        body = render_json(build())
+        entry = {
+            'generation': generation,
+            'body': body,
+            'etag': hashlib.sha1(body).hexdigest(),
+        }
+        with _response_cache_lock:
+            _response_cache[cache_key] = entry
+    return entry
+
+
+def cached_response(cache_key: str, build, cache_control: str):
+    """Serve render_cached() output; a matching If-None-Match gets an empty 304."""
+    entry = render_cached(cache_key, build)
+    resp = app.response_class(entry['body'], mimetype='application/json')
+    resp.set_etag(entry['etag'])
+    resp.headers['Access-Control-Allow-Origin'] = '*'
+    resp.headers['Access-Control-Allow-Headers'] = '*'
+    resp.headers['Cache-Control'] = cache_control
+    return resp.make_conditional(request)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -1096,30 +2363,26 @@ def load_all_videos():
 # ═══════════════════════════════════════════════════════════════════════════
 
 def check_csv_health():
+    """Stat-only check of every series CSV; never reads file contents."""
     missing = []
     invalid = []
     for series in CATALOG['series']:
         path = series.get('videoFile')
         if not path:
             continue
-        if not os.path.exists(path):
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
             missing.append(path)
             logger.error(f"🚨 MISSING CSV: {path}")
-        else:
-            try:
-                size = os.path.getsize(path)
-                if size == 0:
-                    invalid.append(path)
-                    logger.error(f"🚨 EMPTY CSV: {path}")
-                else:
-                    with open(path, 'r') as f:
-                        lines = f.readlines()
-                        if len(lines) < 1:
-                            invalid.append(path)
-                            logger.error(f"🚨 INVALID CSV (no headers): {path}")
-            except Exception as e:
-                invalid.append(path)
-                logger.error(f"🚨 CORRUPTED CSV {path}: {e}")
+            continue
+        except OSError as e:
+            invalid.append(path)
+            logger.error(f"🚨 CORRUPTED CSV {path}: {e}")
+            continue
+        if size == 0:
+            invalid.append(path)
+            logger.error(f"🚨 EMPTY CSV: {path}")
     return missing, invalid
 
 
@@ -1129,14 +2392,17 @@ def check_csv_health():
 
 FEED_DIRECTORIES = ['egor', 'smcg', 'ss', 'smcm']
 
-PIPELINE_BATCH_1 = [
+# Each pipeline depends on the feed fetcher of its parent directory and is
+# started as soon as that fetcher finishes. Listed in start-priority order.
+PIPELINE_DIRECTORIES = [
     'egor/ego', 'egor/eg4', 'smcg/smc', 'smcg/sm4', 'smcg/sms', 'ss/ssf',
-]
-
-PIPELINE_BATCH_2 = [
     'ss/ssm', 'ss/ssf4', 'ss/ssm4', 'smcm/smc', 'smcm/sm4',
 ]
 
+# stage (directory) -> {'seconds', 'ok', 'finished'} for its last run
+_stage_timings: dict = {}
+_stage_timings_lock = threading.Lock()
+
 
 def run_script(directory: str) -> bool:
     script_path = os.path.join(directory, '1formationlap.py')
@@ -1214,10 +2480,18 @@ def run_pipeline_and_reload(directory: str) -> bool:
 
         mtime_after = os.path.getmtime(csv_path) if os.path.exists(csv_path) else 0
         if mtime_after != mtime_before:
+            # Memoized: the reload below reuses this parse instead of re-reading
             parsed = load_videos(csv_path)
             if parsed:
                 logger.info(f"CSV updated: {csv_path} ({len(parsed)} videos) — reloading")
-                load_all_videos()
+                known = _known_info_hashes(csv_path)
+                load_all_videos([csv_path])
+                new_hashes = {v['infoHash'] for v in parsed} - known
+                if new_hashes:
+                    try:
+                        warmup_debrid_availability(new_hashes)
+                    except Exception as e:
+                        logger.error(f"Debrid warmup failed for {csv_path}: {e}")
                 return True
             else:
                 logger.error(f"New CSV {csv_path} parsed to 0 videos — restoring backup")
@@ -1233,63 +2507,444 @@ def run_pipeline_and_reload(directory: str) -> bool:
     return False
 
 
-def run_pipeline_batch(batch: list, batch_name: str):
-    logger.info(f"--- Running pipeline batch '{batch_name}' ({len(batch)} scripts) ---")
-    threads = []
-    for directory in batch:
-        t = Thread(target=run_pipeline_and_reload, args=(directory,), daemon=True)
-        t.start()
-        threads.append(t)
-    for t in threads:
-        t.join()
-    logger.info(f"--- Pipeline batch '{batch_name}' complete ---")
+def _known_info_hashes(csv_path: str) -> set:
+    """Info hashes currently served for the series backed by csv_path."""
+    target = os.path.normpath(csv_path)
+    for series in CATALOG['series']:
+        if os.path.normpath(series.get('videoFile', '')) == target:
+            return {v['infoHash'] for v in series.get('videos') or []}
+    return set()
+
+
+def pipeline_dependencies() -> dict:
+    """
+    stage -> set of stages that must finish first. Feed fetchers are chained
+    so only one hits the upstream RSS sites at a time, as in the serial loop;
+    each feed's pipelines still start as soon as that feed is done.
+    """
+    stages = {directory: set() for directory in FEED_DIRECTORIES}
+    for previous, directory in zip(FEED_DIRECTORIES, FEED_DIRECTORIES[1:]):
+        stages[directory].add(previous)
+    for directory in PIPELINE_DIRECTORIES:
+        parent = directory.split('/')[0]
+        stages[directory] = {parent} if parent in FEED_DIRECTORIES else set()
+    return stages
+
+
+def _run_stage(directory: str) -> bool:
+    runner = run_script if directory in FEED_DIRECTORIES else run_pipeline_and_reload
+    start = now()
+    ok = False
+    try:
+        ok = bool(runner(directory))
+    except Exception as e:
+        logger.error(f"Stage {directory} crashed: {e}")
+    finally:
+        elapsed = now() - start
+        with _stage_timings_lock:
+            _stage_timings[directory] = {'seconds': round(elapsed, 3), 'ok': ok, 'finished': now()}
+        metrics.observe('formulio_pipeline_stage_duration_seconds', elapsed, stage=directory)
+        metrics.inc('formulio_pipeline_stage_runs_total', stage=directory, result='ok' if ok else 'failed')
+        logger.info(f"Stage {directory} {'ok' if ok else 'failed'} in {elapsed:.1f}s")
+    return ok
+
+
+def run_pipeline_cycle():
+    """
+    Run every feed fetcher and pipeline once. A stage starts as soon as its
+    dependencies have finished (successfully or not, as before), with at
+    most PIPELINE_CONCURRENCY subprocesses running at a time.
+    """
+    pending = pipeline_dependencies()
+    done: set = set()
+    running: dict = {}
+    start = now()
+    logger.info(f"--- Pipeline cycle starting ({len(pending)} stages, "
+                f"concurrency {config.PIPELINE_CONCURRENCY}) ---")
+    with ThreadPoolExecutor(max_workers=config.PIPELINE_CONCURRENCY,
+                            thread_name_prefix='pipeline') as pool:
+        while pending or running:
+            for directory in [d for d, deps in pending.items() if deps <= done]:
+                del pending[directory]
+                running[pool.submit(_run_stage, directory)] = directory
+            if not running:
+                logger.error(f"Unsatisfiable pipeline dependencies: {sorted(pending)}")
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done.add(running.pop(future))
+    logger.info(f"--- Pipeline cycle complete in {now() - start:.1f}s ---")
+
+
+def pipeline_stage_stats() -> dict:
+    with _stage_timings_lock:
+        return {stage: dict(timing) for stage, timing in _stage_timings.items()}
 
 
 def run_scripts_in_loop():
     logger.info(f"Script loop starting (Python: {PYTHON_EXE})")
     while True:
-        logger.info("--- Running feed fetchers (sequential) ---")
-        for directory in FEED_DIRECTORIES:
-            run_script(directory)
-        run_pipeline_batch(PIPELINE_BATCH_1, "Batch 1")
-        run_pipeline_batch(PIPELINE_BATCH_2, "Batch 2")
+        run_pipeline_cycle()
         logger.info(f"--- Script loop complete. Sleeping {config.SCRIPT_INTERVAL}s ---")
         time.sleep(config.SCRIPT_INTERVAL)
 
 
+class CSVChangeHandler(FileSystemEventHandler):
+    """
+    Collects watchdog events for the series CSVs and debounces them.
+
+    A file is handed back by wait_due() once it has been quiet for
+    `debounce` seconds, so a pipeline writing in several chunks (or via a
+    temp file and rename) triggers a single reload.
+    """
+
+    def __init__(self, paths, debounce: float):
+        super().__init__()
+        self._paths = {os.path.abspath(p): p for p in paths}
+        self._debounce = debounce
+        self._due: dict = {}
+        self._cond = threading.Condition()
+
+    def _touch(self, path: str):
+        watched = self._paths.get(os.path.abspath(path))
+        if not watched:
+            return
+        with self._cond:
+            self._due[watched] = now() + self._debounce
+            self._cond.notify()
+
+    def on_created(self, event):
+        self._touch(event.src_path)
+
+    def on_modified(self, event):
+        self._touch(event.src_path)
+
+    def on_moved(self, event):
+        self._touch(event.dest_path)
+
+    def wait_due(self, timeout: float) -> list:
+        """Block up to `timeout` seconds for files whose debounce window has passed."""
+        deadline = now() + timeout
+        with self._cond:
+            while True:
+                current = now()
+                due = [path for path, at in self._due.items() if at <= current]
+                if due:
+                    for path in due:
+                        del self._due[path]
+                    return due
+                if current >= deadline:
+                    return []
+                self._cond.wait(min([deadline] + list(self._due.values())) - current)
+
+
+def _csv_mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
 def csv_watcher_loop():
-    csv_mod_times: dict = {}
-    for series in CATALOG['series']:
-        path = series.get('videoFile')
-        if path and os.path.exists(path):
-            csv_mod_times[path] = os.path.getmtime(path)
+    paths = [series['videoFile'] for series in CATALOG['series'] if series.get('videoFile')]
+    csv_mod_times: dict = {path: _csv_mtime(path) for path in paths}
+
+    handler = None
+    if Observer is not None:
+        handler = CSVChangeHandler(paths, config.CSV_WATCH_DEBOUNCE)
+        observer = Observer()
+        for directory in sorted({os.path.dirname(os.path.abspath(path)) for path in paths}):
+            if os.path.isdir(directory):
+                observer.schedule(handler, directory, recursive=False)
+        observer.start()
+        logger.info(f"CSV watcher started (watchdog, {config.CSV_WATCH_DEBOUNCE}s debounce)")
+    else:
+        logger.warning("watchdog not installed — CSV watcher falling back to polling")
 
-    logger.info("CSV watcher started")
+    next_sweep = now() + config.CSV_HEALTH_INTERVAL
     while True:
-        time.sleep(30)
+        wait = max(0.0, next_sweep - now())
+        if handler:
+            changed = handler.wait_due(wait)
+        else:
+            time.sleep(wait)
+            changed = []
         try:
-            missing, invalid = check_csv_health()
-            if missing or invalid:
-                logger.error(f"CSV health check failed: {len(missing)} missing, {len(invalid)} invalid")
-
-            changed = False
-            for series in CATALOG['series']:
-                path = series.get('videoFile')
-                if not path or not os.path.exists(path):
-                    continue
-                mtime = os.path.getmtime(path)
-                if mtime != csv_mod_times.get(path, 0):
-                    csv_mod_times[path] = mtime
-                    changed = True
-                    logger.info(f"CSV watcher detected change: {path}")
+            if now() >= next_sweep:
+                next_sweep = now() + config.CSV_HEALTH_INTERVAL
+                missing, invalid = check_csv_health()
+                if missing or invalid:
+                    logger.error(f"CSV health check failed: {len(missing)} missing, {len(invalid)} invalid")
+                # Safety net for dropped events, and the only path without watchdog
+                changed += [path for path in paths
+                            if path not in changed and _csv_mtime(path) != csv_mod_times[path]]
 
             if changed:
-                logger.info("CSV watcher reloading all videos...")
-                load_all_videos()
+                for path in changed:
+                    csv_mod_times[path] = _csv_mtime(path)
+                    logger.info(f"CSV watcher detected change: {path}")
+                load_all_videos(changed)
         except Exception as e:
             logger.error(f"CSV watcher error: {e}")
 
 
+# ═══════════════════════════════════════════════════════════════════════════
+# Worker Coordination
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Held open for the life of the leader; the kernel drops the flock if the
+# process dies, letting another worker take over.
+_leader_lock_file = None
+
+
+def is_pipeline_leader() -> bool:
+    return _leader_lock_file is not None
+
+
+def try_become_leader() -> bool:
+    global _leader_lock_file
+    if _leader_lock_file is not None:
+        return True
+    if fcntl is None:
+        _leader_lock_file = True
+        return True
+    f = open(config.PIPELINE_LOCK_PATH, 'a')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _leader_lock_file = f
+    return True
+
+
+# Binary catalog snapshot, little-endian:
+#   header   magic, version, written (unix time), #strings, #series
+#   strings  #strings u32 byte lengths, then the UTF-8 blob; every string
+#            below is an index into this table, so repeated titles,
+#            thumbnails and qualities are stored (and loaded) once
+#   series   id, CSV mtime_ns, CSV size, #videos, then one VIDEO record per
+#            video; -1 marks an optional field the CSV row didn't have
+#   cached   #providers, then provider, #hashes, hash indexes
+SNAPSHOT_MAGIC = b'FCAT'
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct('<4sHdII')
+_SNAPSHOT_SERIES = struct.Struct('<IqqI')
+_SNAPSHOT_VIDEO = struct.Struct('<10i')
+_SNAPSHOT_COUNT = struct.Struct('<I')
+_SNAPSHOT_PROVIDER = struct.Struct('<II')
+# Video keys in load_videos() order; dict order is part of the JSON we serve.
+_SNAPSHOT_REQUIRED = ('id', 'season', 'episode', 'title', 'thumbnail', 'infoHash')
+_SNAPSHOT_OPTIONAL = ('fileIdx', 'filesize', 'quality', 'filename')
+
+# Serialises publishes from the pipeline pool, the watcher and the warmup, so
+# writes never interleave and the last rename is always the newest encode.
+_snapshot_publish_lock = threading.Lock()
+
+
+def _encode_catalog_snapshot() -> bytes:
+    strings: dict = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    body = []
+    for series in CATALOG['series']:
+        videos = series.get('videos') or []
+        csv_state = _csv_files.get(os.path.normpath(series.get('videoFile') or ''), {})
+        mtime_ns, size = csv_state.get('stat', (0, -1))
+        body.append(_SNAPSHOT_SERIES.pack(intern(series['id']), mtime_ns, size, len(videos)))
+        for video in videos:
+            body.append(_SNAPSHOT_VIDEO.pack(
+                intern(video['id']), video['season'], video['episode'],
+                intern(video['title']), intern(video['thumbnail']), intern(video['infoHash']),
+                video.get('fileIdx', -1),
+                *(intern(video[key]) if key in video else -1 for key in _SNAPSHOT_OPTIONAL[1:]),
+            ))
+
+    cached = {provider: sorted(hashes) for provider, hashes in _upstream_cached.items()}
+    body.append(_SNAPSHOT_COUNT.pack(len(cached)))
+    for provider, hashes in cached.items():
+        body.append(_SNAPSHOT_PROVIDER.pack(intern(provider), len(hashes)))
+        body.append(struct.pack(f'<{len(hashes)}I', *(intern(h) for h in hashes)))
+
+    encoded = [value.encode('utf-8') for value in strings]
+    return b''.join([
+        _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, now(), len(encoded),
+                              len(CATALOG['series'])),
+        struct.pack(f'<{len(encoded)}I', *(len(value) for value in encoded)),
+        b''.join(encoded),
+    ] + body)
+
+
+def _decode_catalog_snapshot(data: bytes) -> dict:
+    """Decode a snapshot into {'series': {id: (stat, videos)}, 'upstream_cached': {...}}."""
+    magic, version, written, n_strings, n_series = _SNAPSHOT_HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot format {magic!r} v{version}")
+    offset = _SNAPSHOT_HEADER.size
+    lengths = struct.unpack_from(f'<{n_strings}I', data, offset)
+    offset += 4 * n_strings
+    strings = []
+    for length in lengths:
+        strings.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+
+    series_map = {}
+    for _ in range(n_series):
+        id_idx, mtime_ns, size, n_videos = _SNAPSHOT_SERIES.unpack_from(data, offset)
+        offset += _SNAPSHOT_SERIES.size
+        end = offset + n_videos * _SNAPSHOT_VIDEO.size
+        videos = []
+        for (vid, season, episode, title, thumbnail, info_hash,
+             file_idx, filesize, quality, filename) in _SNAPSHOT_VIDEO.iter_unpack(data[offset:end]):
+            video = {
+                'id': strings[vid], 'season': season, 'episode': episode,
+                'title': strings[title], 'thumbnail': strings[thumbnail],
+                'infoHash': strings[info_hash],
+            }
+            if file_idx >= 0:
+                video['fileIdx'] = file_idx
+            if filesize >= 0:
+                video['filesize'] = strings[filesize]
+            if quality >= 0:
+                video['quality'] = strings[quality]
+            if filename >= 0:
+                video['filename'] = strings[filename]
+            videos.append(video)
+        offset = end
+        series_map[strings[id_idx]] = ((mtime_ns, size), videos)
+
+    upstream_cached = {}
+    (n_providers,) = _SNAPSHOT_COUNT.unpack_from(data, offset)
+    offset += _SNAPSHOT_COUNT.size
+    for _ in range(n_providers):
+        provider_idx, count = _SNAPSHOT_PROVIDER.unpack_from(data, offset)
+        offset += _SNAPSHOT_PROVIDER.size
+        hashes = struct.unpack_from(f'<{count}I', data, offset)
+        offset += 4 * count
+        upstream_cached[strings[provider_idx]] = {strings[h] for h in hashes}
+
+    return {'written': written, 'series': series_map, 'upstream_cached': upstream_cached}
+
+
+def publish_catalog_snapshot():
+    """
+    Leader only: write the parsed catalog and upstream-availability sets to
+    CATALOG_SNAPSHOT_PATH. Written to a temp file and renamed into place, so
+    followers only ever see a complete snapshot.
+    """
+    if not is_pipeline_leader():
+        return
+    path = config.CATALOG_SNAPSHOT_PATH
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with _snapshot_publish_lock:
+        try:
+            with _csv_files_lock:
+                data = _encode_catalog_snapshot()
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.error(f"Failed to publish catalog snapshot {path}: {e}")
+
+
+@metrics.timed('formulio_catalog_reload_duration_seconds', source='snapshot')
+def load_catalog_snapshot() -> bool:
+    """
+    Attach to the leader's published catalog with a single read. Returns
+    False if there is no usable snapshot.
+
+    A series whose CSV no longer matches the (mtime, size) recorded in the
+    snapshot is stale and is parsed from the CSV instead. Fresh series seed
+    load_videos' memo, so a later reload doesn't re-read unchanged files.
+    """
+    try:
+        with open(config.CATALOG_SNAPSHOT_PATH, 'rb') as f:
+            snapshot = _decode_catalog_snapshot(f.read())
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.error(f"Unusable catalog snapshot {config.CATALOG_SNAPSHOT_PATH}: {e}")
+        return False
+
+    loaded = stale = 0
+    with _catalog_reload_lock:
+        for series in CATALOG['series']:
+            entry = snapshot['series'].get(series['id'])
+            if not entry or not entry[1]:
+                continue
+            stat_sig, videos = entry
+            video_file = series.get('videoFile')
+            if video_file:
+                try:
+                    st = os.stat(video_file)
+                    current = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    current = stat_sig
+                if current != stat_sig:
+                    stale += 1
+                    videos = load_videos(video_file) or videos
+                else:
+                    with _csv_files_lock:
+                        _csv_files.setdefault(os.path.normpath(video_file),
+                                              {'stat': stat_sig, 'digest': None, 'videos': videos})
+            series['videos'] = videos
+            loaded += 1
+        with _upstream_cached_lock:
+            _upstream_cached.update(snapshot['upstream_cached'])
+        _swap_catalog_index()
+    logger.info(f"Attached to catalog snapshot ({loaded} series, {stale} stale re-parsed)")
+    return True
+
+
+def _snapshot_mtime():
+    try:
+        return os.stat(config.CATALOG_SNAPSHOT_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def pipeline_leader_loop():
+    """
+    Follow the published snapshot until this worker wins the pipeline lock,
+    then run the pipeline (and publish snapshots) for the life of the process.
+    """
+    seen = _snapshot_mtime()
+    next_attempt = 0.0
+    while True:
+        if now() >= next_attempt:
+            if try_become_leader():
+                logger.info(f"Worker {os.getpid()} is pipeline leader")
+                # Our CSV view becomes the published one before the first run
+                if not load_all_videos():
+                    publish_catalog_snapshot()
+                run_scripts_in_loop()
+                return
+            next_attempt = now() + config.PIPELINE_LEADER_RETRY
+
+        mtime = _snapshot_mtime()
+        if mtime is not None and mtime != seen:
+            seen = mtime
+            try:
+                load_catalog_snapshot()
+            except Exception as e:
+                logger.error(f"Catalog snapshot attach failed: {e}")
+        time.sleep(config.SNAPSHOT_POLL_INTERVAL)
+
+
+def start_worker_services():
+    """
+    Per-worker startup (gunicorn post_fork): attach to the shared catalog
+    snapshot, parsing CSVs only if none has been published yet, then start
+    the leader-election / snapshot-follower and metrics flush threads.
+    """
+    if not load_catalog_snapshot():
+        load_all_videos()
+    Thread(target=pipeline_leader_loop, daemon=True).start()
+    Thread(target=metrics_flush_loop, daemon=True).start()
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 # Stream Building
 # ═══════════════════════════════════════════════════════════════════════════
@@ -1312,18 +2967,19 @@ def build_stream_title(video: dict, provider_tag: str) -> str:
 
 
 def _build_debrid_proxy_stream(provider: str, tag: str, video: dict, series: dict,
-                               season: int, debrid_cfg: dict, enable_p2p: bool) -> dict:
+                               season: int, debrid_cfg: dict, host_url: str) -> dict:
     """Build a lazy proxy stream entry for a debrid provider (tb/rd/ad/pm)."""
     info_hash = video['infoHash']
     filename = video.get('filename', '')
     file_idx = video.get('fileIdx', 0)
+    if is_upstream_cached(provider, info_hash):
+        tag = f"{tag} ✅ Cached"
 
-    config_data = json.dumps({'debrid': debrid_cfg, 'enableP2P': enable_p2p})
-    config_b64 = base64.b64encode(config_data.encode('utf-8')).decode('utf-8').rstrip('=')
+    token = config_token(provider, debrid_cfg[provider]['apiKey'])
     encoded_filename = urllib.parse.quote(filename, safe='') if filename else ''
     proxy_url = (
-        f"{request.host_url.rstrip('/')}/{provider}/play"
-        f"/{config_b64}/{info_hash}/{file_idx}/{encoded_filename}"
+        f"{host_url.rstrip('/')}/{provider}/play"
+        f"/{token}/{info_hash}/{file_idx}/{encoded_filename}"
     )
     stream = {
         'title': build_stream_title(video, tag),
@@ -1339,38 +2995,43 @@ def _build_debrid_proxy_stream(provider: str, tag: str, video: dict, series: dic
 
 
 def build_streams_for_video(video: dict, series: dict, season: int, debrid_cfg: dict,
-                            enable_p2p: bool) -> list:
+                            enable_p2p: bool, host_url: str) -> list:
     """
     Build stream entries for a single video.
 
     All debrid providers (TorBox, Real-Debrid, AllDebrid, Premiumize) are lazy:
     they point at a proxy /<provider>/play endpoint that resolves the link when
-    the user presses play. P2P is shown when enabled.
+    the user presses play. Providers known to have the torrent cached upstream
+    are listed first. P2P is shown when enabled.
     """
-    streams: list = []
+    debrid: list = []
     info_hash: str = video['infoHash']
     filename: str = video.get('filename', '')
     file_idx: int = video.get('fileIdx', 0)
 
     # ── TorBox ──────────────────────────────────────────────────────────────
     if debrid_cfg.get('tb', {}).get('apiKey', ''):
-        streams.append(_build_debrid_proxy_stream(
-            'tb', '⚡ [TorBox]', video, series, season, debrid_cfg, enable_p2p))
+        debrid.append(('tb', _build_debrid_proxy_stream(
+            'tb', '⚡ [TorBox]', video, series, season, debrid_cfg, host_url)))
 
     # ── Real-Debrid ──────────────────────────────────────────────────────────
     if debrid_cfg.get('rd', {}).get('apiKey', ''):
-        streams.append(_build_debrid_proxy_stream(
-            'rd', '⚡ [RealDebrid]', video, series, season, debrid_cfg, enable_p2p))
+        debrid.append(('rd', _build_debrid_proxy_stream(
+            'rd', '⚡ [RealDebrid]', video, series, season, debrid_cfg, host_url)))
 
     # ── AllDebrid ────────────────────────────────────────────────────────────
     if debrid_cfg.get('ad', {}).get('apiKey', ''):
-        streams.append(_build_debrid_proxy_stream(
-            'ad', '⚡ [AllDebrid]', video, series, season, debrid_cfg, enable_p2p))
+        debrid.append(('ad', _build_debrid_proxy_stream(
+            'ad', '⚡ [AllDebrid]', video, series, season, debrid_cfg, host_url)))
 
     # ── Premiumize ───────────────────────────────────────────────────────────
     if debrid_cfg.get('pm', {}).get('apiKey', ''):
-        streams.append(_build_debrid_proxy_stream(
-            'pm', '⚡ [Premiumize]', video, series, season, debrid_cfg, enable_p2p))
+        debrid.append(('pm', _build_debrid_proxy_stream(
+            'pm', '⚡ [Premiumize]', video, series, season, debrid_cfg, host_url)))
+
+    # Stable sort: providers with the torrent cached upstream first.
+    debrid.sort(key=lambda entry: not is_upstream_cached(entry[0], info_hash))
+    streams: list = [stream for _, stream in debrid]
 
     # ── P2P ─────────────────────────────────────────────────────────────────
     if enable_p2p:
@@ -1391,44 +3052,128 @@ def build_streams_for_video(video: dict, series: dict, season: int, debrid_cfg:
 
 
 # ═══════════════════════════════════════════════════════════════════════════
-# Proxy Endpoints — RD
+# Stream List Cache
 # ═══════════════════════════════════════════════════════════════════════════
 
-@app.route('/rd/play/<config_str>/<info_hash>/<int:file_idx>/<path:filename>')
-@app.route('/rd/play/<config_str>/<info_hash>/<int:file_idx>/')
-@app.route('/rd/play/<config_str>/<info_hash>/<int:file_idx>')
-def rd_play(config_str: str, info_hash: str, file_idx: int, filename: str = ''):
-    if request.method == 'HEAD':
-        return '', 200
+# (generation, series, season, episode, config fingerprint, host) -> streams.
+# Lists are shared between requests and must not be mutated by callers.
+_stream_cache: OrderedDict = OrderedDict()
+_stream_cache_lock = threading.Lock()
+_stream_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def config_fingerprint(config_str) -> str:
+    return hashlib.sha1(config_str.encode('utf-8')).hexdigest() if config_str else ''
+
+
+def clear_stream_cache():
+    with _stream_cache_lock:
+        _stream_cache.clear()
 
-    cfg = parse_config(config_str)
-    rd_key: str = cfg.get('debrid', {}).get('rd', {}).get('apiKey', '')
-    if not rd_key:
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
 
-    user_ip = get_user_ip()
+def cached_stream_list(key: tuple, build) -> list:
+    with _stream_cache_lock:
+        streams = _stream_cache.get(key)
+        if streams is not None:
+            _stream_cache.move_to_end(key)
+            _stream_cache_stats['hits'] += 1
+            return streams
+        _stream_cache_stats['misses'] += 1
+
+    streams = build()
+    with _stream_cache_lock:
+        _stream_cache[key] = streams
+        while len(_stream_cache) > config.STREAM_CACHE_MAXSIZE:
+            _stream_cache.popitem(last=False)
+            _stream_cache_stats['evictions'] += 1
+    return streams
+
+
+def stream_cache_stats() -> dict:
+    with _stream_cache_lock:
+        return dict(_stream_cache_stats, size=len(_stream_cache))
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Play Resolution
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _tb_stream_url(api_key: str, info_hash: str, file_idx, filename, user_ip=None):
+    return torbox_get_stream_url(api_key, info_hash, file_idx, filename or None, user_ip=user_ip)
+
+
+# provider -> (stream URL resolver, link cache)
+PLAY_PROVIDERS = {
+    'rd': (rd_get_stream_url, _rd_cache),
+    'ad': (ad_get_stream_url, _ad_cache),
+    'tb': (_tb_stream_url, _tb_cache),
+    'pm': (pm_get_stream_url, _pm_cache),
+}
+
+
+def resolve_play_url(provider: str, config_str: str, info_hash: str, file_idx: int,
+                     filename: str, user_ip):
+    """
+    Resolve a /<provider>/play hit to a direct link.
+
+    Returns None when the placeholder video should be served instead (no key,
+    torrent still downloading, or upstream failure). Shared by the Flask and
+    ASGI front ends.
+    """
+    get_stream_url, cache = PLAY_PROVIDERS[provider]
+    tag = provider.upper()
+
+    api_key: str = play_api_key(provider, config_str)
+    if not api_key:
+        return None
+
     if filename:
         filename = urllib.parse.unquote(filename)
 
-    key_hash = hashlib.md5(rd_key.encode()).hexdigest()[:8]
-    cache_key = f"{key_hash}:{info_hash}:{file_idx}:{filename}"
+    key_hash = api_key_hash(api_key)
+    cache_key = play_cache_key(key_hash, info_hash, file_idx, filename)
 
-    cached = rd_cache_get(cache_key)
-    if cached == '__UNAVAILABLE__':
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
+    # Background add/poll jobs write their link here when they finish.
+    cached = cache.get(cache_key)
+    if cached in ('__UNAVAILABLE__', '__PENDING__'):
+        return None
     if cached:
-        logger.info(f"RD cache hit for {info_hash[:8]}")
-        return redirect(cached)
-
-    download_url = rd_get_stream_url(rd_key, info_hash, file_idx, filename, user_ip=user_ip)
-    if download_url:
-        rd_cache_set(cache_key, download_url)
-        logger.info(f"RD resolved {info_hash[:8]}")
-        return redirect(download_url)
-    else:
-        rd_cache_set(cache_key, '__UNAVAILABLE__')
-        logger.info(f"RD not ready for {info_hash[:8]}, serving placeholder")
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
+        logger.info(f"{tag} cache hit for {info_hash[:8]}")
+        return cached
+
+    def resolve():
+        # Writes the cache itself: workers waiting in single_flight read it.
+        download_url = get_stream_url(api_key, info_hash, file_idx, filename, user_ip=user_ip)
+        if download_url:
+            cache.set(cache_key, download_url)
+            logger.info(f"{tag} resolved {info_hash[:8]}")
+            return download_url
+        job_url = cache_unresolved(provider, key_hash, info_hash, cache_key)
+        if not job_url:
+            logger.info(f"{tag} not ready for {info_hash[:8]}, serving placeholder")
+        return job_url
+
+    return single_flight(provider, cache_key, resolve)
+
+
+def _play_response(provider: str, config_str: str, info_hash: str, file_idx: int, filename: str):
+    if request.method == 'HEAD':
+        return '', 200
+    url = resolve_play_url(provider, config_str, info_hash, file_idx, filename, get_user_ip())
+    if url:
+        return redirect(url)
+    return send_from_directory(app.static_folder, 'rd_downloading.mp4')
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Proxy Endpoints — RD
+# ═══════════════════════════════════════════════════════════════════════════
+
+@app.route('/rd/play/<config_str>/<info_hash>/<int:file_idx>/<path:filename>')
+@app.route('/rd/play/<config_str>/<info_hash>/<int:file_idx>/')
+@app.route('/rd/play/<config_str>/<info_hash>/<int:file_idx>')
+def rd_play(config_str: str, info_hash: str, file_idx: int, filename: str = ''):
+    return _play_response('rd', config_str, info_hash, file_idx, filename)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -1439,37 +3184,7 @@ def rd_play(config_str: str, info_hash: str, file_idx: int, filename: str = ''):
 @app.route('/ad/play/<config_str>/<info_hash>/<int:file_idx>/')
 @app.route('/ad/play/<config_str>/<info_hash>/<int:file_idx>')
 def ad_play(config_str: str, info_hash: str, file_idx: int, filename: str = ''):
-    if request.method == 'HEAD':
-        return '', 200
-
-    cfg = parse_config(config_str)
-    ad_key: str = cfg.get('debrid', {}).get('ad', {}).get('apiKey', '')
-    if not ad_key:
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
-
-    user_ip = get_user_ip()
-    if filename:
-        filename = urllib.parse.unquote(filename)
-
-    key_hash = hashlib.md5(ad_key.encode()).hexdigest()[:8]
-    cache_key = f"{key_hash}:{info_hash}:{file_idx}:{filename}"
-
-    cached = ad_cache_get(cache_key)
-    if cached == '__UNAVAILABLE__':
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
-    if cached:
-        logger.info(f"AD cache hit for {info_hash[:8]}")
-        return redirect(cached)
-
-    download_url = ad_get_stream_url(ad_key, info_hash, file_idx, filename, user_ip=user_ip)
-    if download_url:
-        ad_cache_set(cache_key, download_url)
-        logger.info(f"AD resolved {info_hash[:8]}")
-        return redirect(download_url)
-    else:
-        ad_cache_set(cache_key, '__UNAVAILABLE__')
-        logger.info(f"AD not ready for {info_hash[:8]}, serving placeholder")
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
+    return _play_response('ad', config_str, info_hash, file_idx, filename)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -1480,38 +3195,7 @@ def ad_play(config_str: str, info_hash: str, file_idx: int, filename: str = ''):
 @app.route('/tb/play/<config_str>/<info_hash>/<int:file_idx>/')
 @app.route('/tb/play/<config_str>/<info_hash>/<int:file_idx>')
 def tb_play(config_str: str, info_hash: str, file_idx: int, filename: str = ''):
-    if request.method == 'HEAD':
-        return '', 200
-
-    cfg = parse_config(config_str)
-    tb_key: str = cfg.get('debrid', {}).get('tb', {}).get('apiKey', '')
-    if not tb_key:
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
-
-    user_ip = get_user_ip()
-    if filename:
-        filename = urllib.parse.unquote(filename)
-
-    key_hash = hashlib.md5(tb_key.encode()).hexdigest()[:8]
-    cache_key = f"{key_hash}:{info_hash}:{file_idx}:{filename}"
-
-    cached = tb_cache_get(cache_key)
-    if cached == '__UNAVAILABLE__':
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
-    if cached:
-        logger.info(f"TB cache hit for {info_hash[:8]}")
-        return redirect(cached)
-
-    download_url = torbox_get_stream_url(tb_key, info_hash, file_idx, filename or None,
-                                         user_ip=user_ip)
-    if download_url:
-        tb_cache_set(cache_key, download_url)
-        logger.info(f"TB resolved {info_hash[:8]}")
-        return redirect(download_url)
-    else:
-        tb_cache_set(cache_key, '__UNAVAILABLE__')
-        logger.info(f"TB not ready for {info_hash[:8]}, serving placeholder")
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
+    return _play_response('tb', config_str, info_hash, file_idx, filename)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -1522,131 +3206,281 @@ def tb_play(config_str: str, info_hash: str, file_idx: int, filename: str = ''):
 @app.route('/pm/play/<config_str>/<info_hash>/<int:file_idx>/')
 @app.route('/pm/play/<config_str>/<info_hash>/<int:file_idx>')
 def pm_play(config_str: str, info_hash: str, file_idx: int, filename: str = ''):
-    if request.method == 'HEAD':
-        return '', 200
+    return _play_response('pm', config_str, info_hash, file_idx, filename)
 
-    cfg = parse_config(config_str)
-    pm_key: str = cfg.get('debrid', {}).get('pm', {}).get('apiKey', '')
-    if not pm_key:
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
 
-    user_ip = get_user_ip()
-    if filename:
-        filename = urllib.parse.unquote(filename)
+# ═══════════════════════════════════════════════════════════════════════════
+# API Validation Proxy Endpoints
+# ═══════════════════════════════════════════════════════════════════════════
 
-    key_hash = hashlib.md5(pm_key.encode()).hexdigest()[:8]
-    cache_key = f"{key_hash}:{info_hash}:{file_idx}:{filename}"
+def _tb_validation(api_key: str):
+    user_data = torbox_validate_key(api_key)
+    if user_data:
+        return {
+            'success': True,
+            'plan': user_data.get('plan', 'Unknown'),
+            'email': user_data.get('email', '')
+        }
+    return {'success': False, 'error': 'Invalid API key'}
 
-    cached = pm_cache_get(cache_key)
-    if cached == '__UNAVAILABLE__':
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
-    if cached:
-        logger.info(f"PM cache hit for {info_hash[:8]}")
-        return redirect(cached)
-
-    download_url = pm_get_stream_url(pm_key, info_hash, file_idx, filename, user_ip=user_ip)
-    if download_url:
-        pm_cache_set(cache_key, download_url)
-        logger.info(f"PM resolved {info_hash[:8]}")
-        return redirect(download_url)
-    else:
-        pm_cache_set(cache_key, '__UNAVAILABLE__')
-        logger.info(f"PM not ready for {info_hash[:8]}, serving placeholder")
-        return send_from_directory(app.static_folder, 'rd_downloading.mp4')
 
+def _rd_validation(api_key: str):
+    user_data = rd_validate_key(api_key)
+    if user_data:
+        return {
+            'success': True,
+            'username': user_data.get('username', ''),
+            'type': user_data.get('type', 'free'),
+            'expiration': user_data.get('expiration', '')
+        }
+    return {'success': False, 'error': 'Invalid API token'}
 
-# ═══════════════════════════════════════════════════════════════════════════
-# API Validation Proxy Endpoints
-# ═══════════════════════════════════════════════════════════════════════════
 
-@app.route('/api/validate/tb', methods=['POST'])
-def validate_torbox():
+def _ad_validation(api_key: str):
+    user_data = ad_validate_key(api_key)
+    if user_data:
+        is_premium: bool = user_data.get('isPremium', False)
+        is_trial: bool = user_data.get('isTrial', False)
+        account_type = 'premium' if is_premium else ('trial' if is_trial else 'free')
+        return {
+            'success': True,
+            'username': user_data.get('username', ''),
+            'email': user_data.get('email', ''),
+            'type': account_type,
+            'isPremium': is_premium
+        }
+    return {'success': False, 'error': 'Invalid API key'}
+
+
+def _pm_validation(api_key: str):
+    info = pm_validate_key(api_key)
+    if info:
+        premium_until = info.get('premium_until')
+        is_premium = bool(premium_until) and premium_until > now()
+        account_type = 'premium' if is_premium else 'free'
+        return {
+            'success': True,
+            'username': info.get('customer_id', ''),
+            'type': account_type,
+            'isPremium': is_premium
+        }
+    return {'success': False, 'error': 'Invalid API key'}
+
+
+VALIDATORS = {
+    'tb': _tb_validation,
+    'rd': _rd_validation,
+    'ad': _ad_validation,
+    'pm': _pm_validation,
+}
+
+
+def validate_api_key(provider: str, data: dict) -> dict:
+    """Body for /api/validate/<provider>. Shared by the Flask and ASGI front ends."""
     try:
-        data = request.get_json(silent=True) or {}
         api_key: str = data.get('apiKey', '').strip()
         if not api_key:
-            return respond_with({'success': False, 'error': 'No API key provided'})
-        user_data = torbox_validate_key(api_key)
-        if user_data:
-            return respond_with({
-                'success': True,
-                'plan': user_data.get('plan', 'Unknown'),
-                'email': user_data.get('email', '')
-            })
-        return respond_with({'success': False, 'error': 'Invalid API key'})
+            return {'success': False, 'error': 'No API key provided'}
+        return VALIDATORS[provider](api_key)
     except Exception as e:
-        logger.error(f"TB validation proxy error: {e}")
-        return respond_with({'success': False, 'error': 'Validation failed'})
+        logger.error(f"{provider.upper()} validation proxy error: {e}")
+        return {'success': False, 'error': 'Validation failed'}
+
+
+@app.route('/api/validate/tb', methods=['POST'])
+def validate_torbox():
+    return respond_with(validate_api_key('tb', request.get_json(silent=True) or {}))
 
 
 @app.route('/api/validate/rd', methods=['POST'])
 def validate_realdebrid():
-    try:
-        data = request.get_json(silent=True) or {}
-        api_key: str = data.get('apiKey', '').strip()
-        if not api_key:
-            return respond_with({'success': False, 'error': 'No API key provided'})
-        user_data = rd_validate_key(api_key)
-        if user_data:
-            return respond_with({
-                'success': True,
-                'username': user_data.get('username', ''),
-                'type': user_data.get('type', 'free'),
-                'expiration': user_data.get('expiration', '')
-            })
-        return respond_with({'success': False, 'error': 'Invalid API token'})
-    except Exception as e:
-        logger.error(f"RD validation proxy error: {e}")
-        return respond_with({'success': False, 'error': 'Validation failed'})
+    return respond_with(validate_api_key('rd', request.get_json(silent=True) or {}))
 
 
 @app.route('/api/validate/ad', methods=['POST'])
 def validate_alldebrid():
-    try:
-        data = request.get_json(silent=True) or {}
-        api_key: str = data.get('apiKey', '').strip()
-        if not api_key:
-            return respond_with({'success': False, 'error': 'No API key provided'})
-        user_data = ad_validate_key(api_key)
-        if user_data:
-            is_premium: bool = user_data.get('isPremium', False)
-            is_trial: bool = user_data.get('isTrial', False)
-            account_type = 'premium' if is_premium else ('trial' if is_trial else 'free')
-            return respond_with({
-                'success': True,
-                'username': user_data.get('username', ''),
-                'email': user_data.get('email', ''),
-                'type': account_type,
-                'isPremium': is_premium
-            })
-        return respond_with({'success': False, 'error': 'Invalid API key'})
-    except Exception as e:
-        logger.error(f"AD validation proxy error: {e}")
-        return respond_with({'success': False, 'error': 'Validation failed'})
+    return respond_with(validate_api_key('ad', request.get_json(silent=True) or {}))
 
 
 @app.route('/api/validate/pm', methods=['POST'])
 def validate_premiumize():
+    return respond_with(validate_api_key('pm', request.get_json(silent=True) or {}))
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Metrics Export
+# ═══════════════════════════════════════════════════════════════════════════
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_METRIC_HELP = {
+    'formulio_http_request_duration_seconds': ('histogram', 'Request latency by route.'),
+    'formulio_debrid_request_duration_seconds': ('histogram', 'Debrid API latency by provider and endpoint.'),
+    'formulio_debrid_requests_total': ('counter', 'Debrid API calls by provider, endpoint and status.'),
+    'formulio_catalog_reload_duration_seconds': ('histogram', 'Catalog reload time by source.'),
+    'formulio_pipeline_stage_duration_seconds': ('histogram', 'Feed fetcher / pipeline run time by stage.'),
+    'formulio_pipeline_stage_runs_total': ('counter', 'Pipeline stage runs by result.'),
+    'formulio_link_cache_events_total': ('counter', 'Debrid link cache hits, misses, evictions and expirations.'),
+    'formulio_link_cache_entries': ('gauge', 'Entries held in each debrid link cache.'),
+    'formulio_stream_cache_events_total': ('counter', 'Stream list cache hits, misses and evictions.'),
+    'formulio_stream_cache_entries': ('gauge', 'Entries held in the stream list cache.'),
+    'formulio_single_flight_coalesced_total': ('counter', 'Play resolutions that joined an in-flight one.'),
+    'formulio_single_flight_in_flight': ('gauge', 'Play resolutions currently running.'),
+    'formulio_http_pool_requests_total': ('counter', 'Requests sent through each provider connection pool.'),
+    'formulio_http_pool_connections_total': ('counter', 'Connections opened by each provider connection pool.'),
+    'formulio_catalog_generation': ('gauge', 'Catalog generation served by each worker.'),
+}
+
+
+def _collect_metrics():
+    """Cumulative per-worker stats kept elsewhere, as (counters, gauges)."""
+    counters, gauges = [], []
+    for cache, stats in cache_stats().items():
+        for event in ('hits', 'misses', 'shared_hits', 'evictions', 'expirations'):
+            counters.append(['formulio_link_cache_events_total', {'cache': cache, 'event': event}, stats[event]])
+        gauges.append(['formulio_link_cache_entries', {'cache': cache}, stats['size']])
+    stream_stats = stream_cache_stats()
+    for event in ('hits', 'misses', 'evictions'):
+        counters.append(['formulio_stream_cache_events_total', {'event': event}, stream_stats[event]])
+    gauges.append(['formulio_stream_cache_entries', {}, stream_stats['size']])
+    flight = single_flight_stats()
+    for provider, count in flight['coalesced'].items():
+        counters.append(['formulio_single_flight_coalesced_total', {'provider': provider}, count])
+    gauges.append(['formulio_single_flight_in_flight', {}, flight['in_flight']])
+    for provider, stats in http_pool_stats().items():
+        counters.append(['formulio_http_pool_requests_total', {'provider': provider}, stats['requests']])
+        counters.append(['formulio_http_pool_connections_total', {'provider': provider}, stats['connections']])
+    gauges.append(['formulio_catalog_generation', {'pid': str(os.getpid())}, _catalog_generation])
+    return counters, gauges
+
+
+# The flush thread and /metrics requests both flush; they share one temp file.
+_metrics_flush_lock = threading.Lock()
+
+
+def flush_metrics():
+    """Write this worker's metrics to METRICS_DIR/<pid>.json atomically."""
+    pid = os.getpid()
+    data = metrics.snapshot()
+    collected, data['gauges'] = _collect_metrics()
+    data['counters'] += collected
+    data['pid'] = pid
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    path = os.path.join(config.METRICS_DIR, f"{pid}.json")
+    with _metrics_flush_lock:
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(f"{path}.tmp", path)
+
+
+def metrics_flush_loop():
+    while True:
+        time.sleep(config.METRICS_FLUSH_INTERVAL)
+        try:
+            flush_metrics()
+        except Exception as e:
+            logger.error(f"Metrics flush failed: {e}")
+
+
+def reset_metrics_dir():
+    """Drop per-worker files from a previous server run (gunicorn on_starting)."""
+    shutil.rmtree(config.METRICS_DIR, ignore_errors=True)
+
+
+def _pid_alive(pid: int) -> bool:
     try:
-        data = request.get_json(silent=True) or {}
-        api_key: str = data.get('apiKey', '').strip()
-        if not api_key:
-            return respond_with({'success': False, 'error': 'No API key provided'})
-        info = pm_validate_key(api_key)
-        if info:
-            premium_until = info.get('premium_until')
-            is_premium = bool(premium_until) and premium_until > now()
-            account_type = 'premium' if is_premium else 'free'
-            return respond_with({
-                'success': True,
-                'username': info.get('customer_id', ''),
-                'type': account_type,
-                'isPremium': is_premium
-            })
-        return respond_with({'success': False, 'error': 'Invalid API key'})
-    except Exception as e:
-        logger.error(f"PM validation proxy error: {e}")
-        return respond_with({'success': False, 'error': 'Validation failed'})
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(labels: dict, extra: str = '') -> str:
+    parts = []
+    for key, value in sorted(labels.items()):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def render_metrics() -> str:
+    """
+    Prometheus text exposition summed across every worker's file.
+
+    Counters and histograms of exited workers are kept so totals never go
+    backwards; their gauges are dropped.
+    """
+    flush_metrics()
+    counters: dict = {}
+    gauges: dict = {}
+    histograms: dict = {}
+    for name in os.listdir(config.METRICS_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(config.METRICS_DIR, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, labels, value in data.get('counters', []):
+            key = (metric, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        if _pid_alive(data.get('pid', 0)):
+            for metric, labels, value in data.get('gauges', []):
+                key = (metric, tuple(sorted(labels.items())))
+                gauges[key] = gauges.get(key, 0) + value
+        for metric, labels, hist in data.get('histograms', []):
+            key = (metric, tuple(sorted(labels.items())))
+            total = histograms.get(key)
+            histograms[key] = hist if total is None else [a + b for a, b in zip(total, hist)]
+
+    by_name: dict = {}
+    for kind, values in (('counter', counters), ('gauge', gauges), ('histogram', histograms)):
+        for (metric, labels), value in values.items():
+            by_name.setdefault(metric, (kind, []))[1].append((dict(labels), value))
+
+    lines = []
+    for metric in sorted(by_name):
+        kind, series = by_name[metric]
+        help_text = _METRIC_HELP.get(metric, (kind, metric))[1]
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for labels, value in sorted(series, key=lambda item: sorted(item[0].items())):
+            if kind != 'histogram':
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(METRIC_BUCKETS + ('+Inf',), value[:-1]):
+                cumulative += count
+                le = 'le="' + str(bound) + '"'
+                lines.append(f"{metric}_bucket{_format_labels(labels, le)} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {value[-1]}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('formulio_http_request_duration_seconds', time.perf_counter() - start,
+                        route=route, method=request.method, status=str(response.status_code))
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return render_metrics(), 200, {'Content-Type': METRICS_CONTENT_TYPE, 'Cache-Control': 'no-store'}
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -1674,7 +3508,7 @@ def static_files(filename: str):
 
 @app.route('/manifest.json')
 def manifest_default():
-    return respond_with(MANIFEST)
+    return cached_response('manifest', lambda: MANIFEST, CATALOG_CACHE_CONTROL)
 
 
 @app.route('/catalog/<type>/<id>.json')
@@ -1709,10 +3543,14 @@ def stream_default(type: str, id: str):
 @app.route('/<config_str>/manifest.json')
 def manifest_configured(config_str: str):
     parse_config(config_str)
+    return cached_response('manifest:configured', _configured_manifest, CATALOG_CACHE_CONTROL)
+
+
+def _configured_manifest() -> dict:
     manifest = dict(MANIFEST)
     manifest['id'] = 'org.stremio.formulio.configured'
     manifest['name'] = 'Formulio'
-    return respond_with(manifest)
+    return manifest
 
 
 @app.route('/<config_str>/catalog/<type>/<id>.json')
@@ -1744,57 +3582,60 @@ def stream_configured(config_str: str, type: str, id: str):
 # Route Handlers
 # ═══════════════════════════════════════════════════════════════════════════
 
-def _handle_catalog(type: str):
-    if type not in MANIFEST['types']:
-        abort(404)
-    catalog = CATALOG.get(type, [])
-    return respond_with({
+def catalog_metas(type: str, items) -> dict:
+    return {
         'metas': [{
             'id': item['id'], 'type': type, 'name': item['name'],
             'genres': item.get('genres', []), 'poster': item['poster']
-        } for item in catalog]
-    })
+        } for item in items]
+    }
+
+
+def genre_items(type: str, genre: str) -> list:
+    return [item for item in CATALOG.get(type, []) if genre in item.get('genres', [])]
+
+
+def _handle_catalog(type: str):
+    if type not in MANIFEST['types']:
+        abort(404)
+    return cached_response(
+        f"catalog:{type}",
+        lambda: catalog_metas(type, CATALOG.get(type, [])),
+        CATALOG_CACHE_CONTROL,
+    )
 
 
 def _handle_catalog_genre(type: str, genre: str):
     if type not in MANIFEST['types']:
         abort(404)
     genre = urllib.parse.unquote(genre)
-    catalog = CATALOG.get(type, [])
-    filtered = [item for item in catalog if genre in item.get('genres', [])]
-    return respond_with({
-        'metas': [{
-            'id': item['id'], 'type': type, 'name': item['name'],
-            'genres': item.get('genres', []), 'poster': item['poster']
-        } for item in filtered]
-    })
+
+    def build():
+        return catalog_metas(type, genre_items(type, genre))
+
+    # Only cache genres we advertise, so arbitrary genre strings can't grow the cache.
+    if genre in MANIFEST_GENRES:
+        return cached_response(f"catalog:{type}:genre={genre}", build, CATALOG_CACHE_CONTROL)
+    return respond_with(build())
 
 
 def _handle_catalog_search(type: str, query: str):
     if type not in MANIFEST['types']:
         abort(404)
-    query = urllib.parse.unquote(query).lower()
-    catalog = CATALOG.get(type, [])
-    results = []
-    for item in catalog:
-        if query in item['name'].lower():
-            results.append(item)
-        elif item.get('description') and query in item['description'].lower():
-            results.append(item)
-        elif any(query in v.get('title', '').lower() for v in item.get('videos', [])):
-            results.append(item)
-    return respond_with({
-        'metas': [{
-            'id': item['id'], 'type': type, 'name': item['name'],
-            'genres': item.get('genres', []), 'poster': item['poster']
-        } for item in results]
-    })
+    return respond_with(catalog_metas(type, search_catalog(type, query)))
+
+
+def search_catalog(type: str, query: str) -> list:
+    index = _catalog_index['search'].get(type)
+    if index is None:
+        return []
+    return index.search(urllib.parse.unquote(query))
 
 
 def _handle_meta(type: str, id: str):
     if type not in MANIFEST['types']:
         abort(404)
-    item = next((i for i in CATALOG.get(type, []) if i['id'] == id), None)
+    item = get_series(id)
     if not item:
         abort(404)
 
@@ -1804,9 +3645,13 @@ def _handle_meta(type: str, id: str):
         logger.error(f"Meta for {id} has 0 videos — returning 503 to avoid bad cache")
         resp = jsonify({'meta': {}, 'error': 'Catalog temporarily unavailable'})
         resp.headers['Access-Control-Allow-Origin'] = '*'
-        resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+        resp.headers['Cache-Control'] = STREAM_CACHE_CONTROL
         return resp, 503
 
+    return cached_response(f"meta:{type}:{id}", lambda: build_meta(type, item), META_CACHE_CONTROL)
+
+
+def build_meta(type: str, item: dict) -> dict:
     meta = {k: item[k] for k in item if k in OPTIONAL_META}
     meta.update({
         'id': item['id'], 'type': type, 'name': item['name'],
@@ -1817,54 +3662,66 @@ def _handle_meta(type: str, id: str):
             'title': v['title'], 'thumbnail': v['thumbnail'],
             'season': v['season'], 'episode': v['episode'],
             'released': v.get('released', '2026-01-01T00:00:00.000Z'),
-        } for v in videos]
+        } for v in item.get('videos') or []]
     })
+    return {'meta': meta}
 
-    resp = jsonify({'meta': meta})
-    resp.headers['Access-Control-Allow-Origin'] = '*'
-    resp.headers['Access-Control-Allow-Headers'] = '*'
-    resp.headers['Cache-Control'] = 'public, max-age=300'
-    return resp
 
+def build_stream_list(type: str, id: str, config_str, host_url: str) -> list:
+    """
+    Build the stream list for a /stream request.
 
-def _handle_stream(type: str, id: str, config_str):
+    Results are memoized per catalog generation, episode, config and host, so
+    a client stepping through episodes gets pre-built lists. Raises
+    LookupError for unknown series/episodes and ValueError for a malformed
+    id, so each front end can map them to 404/400.
+    """
     if type not in MANIFEST['types']:
-        abort(404)
-
-    cfg: dict = parse_config(config_str) if config_str else {'debrid': {}, 'enableP2P': True}
-    debrid_cfg: dict = cfg.get('debrid', {})
-    enable_p2p: bool = cfg.get('enableP2P', True)
+        raise LookupError(type)
 
-    if not debrid_cfg and not enable_p2p:
-        enable_p2p = True
+    # Read before the index: a reload in between then files this list under
+    # the old generation, where nothing will look it up.
+    generation = _catalog_generation
 
     if ':' in id:
-        try:
-            series_id, season_s, episode_s = id.split(':')
-            season = int(season_s)
-            episode = int(episode_s)
-        except ValueError:
-            abort(400)
+        series_id, season_s, episode_s = id.split(':')
+        season = int(season_s)
+        episode = int(episode_s)
     else:
-        series_id, season, episode = id, 1, 1
+        series_id, season, episode = id, 1, None
 
-    series = next((s for s in CATALOG.get(type, []) if s['id'] == series_id), None)
+    series = get_series(series_id)
     if not series:
-        abort(404)
+        raise LookupError(series_id)
 
-    if ':' in id:
-        videos = [v for v in series['videos'] if v['season'] == season and v['episode'] == episode]
+    if episode is not None:
+        videos = get_episode_videos(series_id, season, episode)
     else:
         videos = series['videos']
 
     if not videos:
-        abort(404)
+        raise LookupError(id)
+
+    key = (generation, series_id, season, episode,
+           config_fingerprint(config_str), host_url)
+    return cached_stream_list(
+        key, lambda: _build_stream_list(id, series, season, videos, config_str, host_url)
+    )
+
+
+def _build_stream_list(id: str, series: dict, season: int, videos, config_str, host_url: str) -> list:
+    cfg: dict = parse_config(config_str) if config_str else {'debrid': {}, 'enableP2P': True}
+    debrid_cfg: dict = cfg.get('debrid', {})
+    enable_p2p: bool = cfg.get('enableP2P', True)
+
+    if not debrid_cfg and not enable_p2p:
+        enable_p2p = True
 
     all_streams: list = []
     for video in videos:
         try:
             all_streams.extend(
-                build_streams_for_video(video, series, season, debrid_cfg, enable_p2p)
+                build_streams_for_video(video, series, season, debrid_cfg, enable_p2p, host_url)
             )
         except Exception as e:
             logger.error(f"Error building streams for {video.get('infoHash', '?')[:8]}: {e}")
@@ -1885,10 +3742,21 @@ def _handle_stream(type: str, id: str, config_str):
                 fallback['behaviorHints']['filename'] = video['filename']
             all_streams.append(fallback)
 
+    return all_streams
+
+
+def _handle_stream(type: str, id: str, config_str):
+    try:
+        all_streams = build_stream_list(type, id, config_str, request.host_url)
+    except LookupError:
+        abort(404)
+    except ValueError:
+        abort(400)
+
     resp = jsonify({'streams': all_streams})
     resp.headers['Access-Control-Allow-Origin'] = '*'
     resp.headers['Access-Control-Allow-Headers'] = '*'
-    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    resp.headers['Cache-Control'] = STREAM_CACHE_CONTROL
     return resp
 
 
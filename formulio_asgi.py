@@ -0,0 +1,312 @@
+"""
+ASGI front end for the Formulio addon.
+
+Serves the same Stremio routes as the Flask app in formulio_addon (manifest,
+catalog, meta, stream, /<provider>/play and /api/validate/*) from async
+handlers.
+
+Catalog, meta and stream responses are pure in-memory work and run straight
+on the event loop, so they never wait on debrid traffic. The debrid clients
+are still the blocking requests-based helpers shared with the WSGI app
+(caches, library indexes, background jobs): each play or validate call that
+misses the cache holds one thread of a pool of ASGI_RESOLVE_THREADS (default
+64) for its sequential HTTP calls, which caps a worker at that many distinct
+resolutions at once. Further ones queue. Identical concurrent play requests
+await a single resolution instead of each taking a thread.
+
+Run with:
+    gunicorn -c gunicorn_asgi_config.py formulio_asgi:app
+"""
+
+import asyncio
+import functools
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, RedirectResponse, Response
+from starlette.routing import Route
+
+import formulio_addon as core
+from formulio_addon import logger
+
+
+# Max distinct debrid resolutions in progress per worker (see module docstring)
+ASGI_RESOLVE_THREADS = int(os.environ.get('ASGI_RESOLVE_THREADS', 64))
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_RESOLVE_THREADS, thread_name_prefix='asgi-debrid')
+
+# (provider, config_str, info_hash, file_idx, filename) -> asyncio.Future
+_inflight: dict = {}
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+PLACEHOLDER = os.path.join(STATIC_DIR, 'rd_downloading.mp4')
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': '*',
+}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Helpers
+# ═══════════════════════════════════════════════════════════════════════════
+
+async def run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+def _forwarded(request, name: str):
+    # Mirror ProxyFix(x_for=1, x_proto=1, x_host=1, x_prefix=1): trust the
+    # last hop only.
+    value = request.headers.get(name)
+    if not value:
+        return None
+    return value.split(',')[-1].strip()
+
+
+def host_url(request) -> str:
+    scheme = _forwarded(request, 'x-forwarded-proto') or request.url.scheme
+    host = _forwarded(request, 'x-forwarded-host') or request.headers.get('host', request.url.netloc)
+    prefix = (_forwarded(request, 'x-forwarded-prefix') or '').rstrip('/')
+    return f"{scheme}://{host}{prefix}/"
+
+
+def user_ip(request):
+    return _forwarded(request, 'x-forwarded-for') or (request.client.host if request.client else None)
+
+
+def json_response(data, cache_control: str, status_code: int = 200) -> Response:
+    headers = dict(CORS_HEADERS, **{'Cache-Control': cache_control})
+    return Response(core.render_json(data), status_code=status_code,
+                    media_type='application/json', headers=headers)
+
+
+def cached_json_response(request, cache_key: str, build, cache_control: str) -> Response:
+    entry = core.render_cached(cache_key, build)
+    etag = f'"{entry["etag"]}"'
+    headers = dict(CORS_HEADERS, **{'Cache-Control': cache_control, 'ETag': etag})
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in [t.strip() for t in if_none_match.split(',')] or if_none_match.strip() == '*':
+        return Response(status_code=304, headers=headers)
+    return Response(entry['body'], media_type='application/json', headers=headers)
+
+
+def not_found() -> Response:
+    return Response('Not Found', status_code=404)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Manifest, Catalog & Meta
+# ═══════════════════════════════════════════════════════════════════════════
+
+async def manifest(request):
+    if 'config_str' in request.path_params:
+        core.parse_config(request.path_params['config_str'])
+        return cached_json_response(request, 'manifest:configured', core._configured_manifest,
+                                    core.CATALOG_CACHE_CONTROL)
+    return cached_json_response(request, 'manifest', lambda: core.MANIFEST, core.CATALOG_CACHE_CONTROL)
+
+
+async def catalog(request):
+    type = request.path_params['type']
+    if type not in core.MANIFEST['types']:
+        return not_found()
+    return cached_json_response(
+        request, f"catalog:{type}",
+        lambda: core.catalog_metas(type, core.CATALOG.get(type, [])),
+        core.CATALOG_CACHE_CONTROL,
+    )
+
+
+async def catalog_genre(request):
+    type = request.path_params['type']
+    if type not in core.MANIFEST['types']:
+        return not_found()
+    genre = urllib.parse.unquote(request.path_params['genre'])
+
+    def build():
+        return core.catalog_metas(type, core.genre_items(type, genre))
+
+    if genre in core.MANIFEST_GENRES:
+        return cached_json_response(request, f"catalog:{type}:genre={genre}", build,
+                                    core.CATALOG_CACHE_CONTROL)
+    return json_response(build(), core.CATALOG_CACHE_CONTROL)
+
+
+async def catalog_search(request):
+    type = request.path_params['type']
+    if type not in core.MANIFEST['types']:
+        return not_found()
+    results = core.search_catalog(type, request.path_params['query'])
+    return json_response(core.catalog_metas(type, results), core.CATALOG_CACHE_CONTROL)
+
+
+async def meta(request):
+    type, id = request.path_params['type'], request.path_params['id']
+    if type not in core.MANIFEST['types']:
+        return not_found()
+    item = core.get_series(id)
+    if not item:
+        return not_found()
+    if not item.get('videos'):
+        logger.error(f"Meta for {id} has 0 videos — returning 503 to avoid bad cache")
+        return json_response({'meta': {}, 'error': 'Catalog temporarily unavailable'},
+                             core.STREAM_CACHE_CONTROL, status_code=503)
+    return cached_json_response(request, f"meta:{type}:{id}", lambda: core.build_meta(type, item),
+                                core.META_CACHE_CONTROL)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Streams
+# ═══════════════════════════════════════════════════════════════════════════
+
+async def stream(request):
+    try:
+        streams = core.build_stream_list(
+            request.path_params['type'], request.path_params['id'],
+            request.path_params.get('config_str'), host_url(request),
+        )
+    except LookupError:
+        return not_found()
+    except ValueError:
+        return Response('Bad Request', status_code=400)
+    return json_response({'streams': streams}, core.STREAM_CACHE_CONTROL)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Play & Validation
+# ═══════════════════════════════════════════════════════════════════════════
+
+async def resolve_play_url(provider: str, config_str: str, info_hash: str, file_idx: int,
+                           filename: str, ip):
+    """Await core.resolve_play_url, sharing one thread-pool call per identical request."""
+    key = (provider, config_str, info_hash, file_idx, filename)
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        url = await run_blocking(core.resolve_play_url, provider, config_str, info_hash,
+                                 file_idx, filename, ip)
+        future.set_result(url)
+    except Exception as e:
+        logger.error(f"{provider.upper()} play resolution error for {info_hash[:8]}: {e}")
+        future.set_result(None)
+    finally:
+        del _inflight[key]
+        if not future.done():
+            # This request was cancelled (client went away); release the
+            # followers with the placeholder rather than leaving them hanging.
+            future.set_result(None)
+    return future.result()
+
+
+def _play_route(provider: str):
+    async def play(request):
+        if request.method == 'HEAD':
+            return Response(status_code=200)
+        params = request.path_params
+        url = await resolve_play_url(provider, params['config_str'], params['info_hash'],
+                                     params['file_idx'], params.get('filename', ''),
+                                     user_ip(request))
+        if url:
+            return RedirectResponse(url, status_code=302)
+        return FileResponse(PLACEHOLDER)
+    return play
+
+
+def _validate_route(provider: str):
+    async def validate(request):
+        try:
+            data = await request.json()
+        except Exception:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        result = await run_blocking(core.validate_api_key, provider, data)
+        return json_response(result, core.CATALOG_CACHE_CONTROL)
+    return validate
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Metrics
+# ═══════════════════════════════════════════════════════════════════════════
+
+async def metrics(request):
+    body = await run_blocking(core.render_metrics)
+    return Response(body, headers={'Content-Type': core.METRICS_CONTENT_TYPE, 'Cache-Control': 'no-store'})
+
+
+def route(path: str, endpoint, **kwargs) -> Route:
+    """Route whose latency is recorded under its path template, like the Flask rule."""
+    @functools.wraps(endpoint)
+    async def timed(request):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await endpoint(request)
+            status = response.status_code
+            return response
+        finally:
+            core.metrics.observe('formulio_http_request_duration_seconds', time.perf_counter() - start,
+                                 route=path, method=request.method, status=str(status))
+    return Route(path, timed, **kwargs)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# Static Pages
+# ═══════════════════════════════════════════════════════════════════════════
+
+async def index(request):
+    return FileResponse(os.path.join(STATIC_DIR, 'index.html'))
+
+
+async def images(request):
+    path = os.path.normpath(os.path.join(IMAGES_DIR, request.path_params['filename']))
+    if not path.startswith(IMAGES_DIR + os.sep) or not os.path.isfile(path):
+        return not_found()
+    return FileResponse(path)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# App
+# ═══════════════════════════════════════════════════════════════════════════
+
+routes = []
+for _provider in core.PLAY_PROVIDERS:
+    _play = _play_route(_provider)
+    routes += [
+        route(f'/{_provider}/play/{{config_str}}/{{info_hash}}/{{file_idx:int}}/{{filename:path}}', _play),
+        route(f'/{_provider}/play/{{config_str}}/{{info_hash}}/{{file_idx:int}}/', _play),
+        route(f'/{_provider}/play/{{config_str}}/{{info_hash}}/{{file_idx:int}}', _play),
+    ]
+    routes.append(route(f'/api/validate/{_provider}', _validate_route(_provider), methods=['POST']))
+
+routes += [
+    route('/', index),
+    route('/{config_str}/configure', index),
+    route('/images/{filename:path}', images),
+    route('/metrics', metrics),
+
+    route('/manifest.json', manifest),
+    route('/catalog/{type}/{id}.json', catalog),
+    route('/catalog/{type}/{id}/genre={genre}.json', catalog_genre),
+    route('/catalog/{type}/{id}/search={query}.json', catalog_search),
+    route('/meta/{type}/{id}.json', meta),
+    route('/stream/{type}/{id}.json', stream),
+
+    route('/{config_str}/manifest.json', manifest),
+    route('/{config_str}/catalog/{type}/{id}.json', catalog),
+    route('/{config_str}/catalog/{type}/{id}/genre={genre}.json', catalog_genre),
+    route('/{config_str}/catalog/{type}/{id}/search={query}.json', catalog_search),
+    route('/{config_str}/meta/{type}/{id}.json', meta),
+    route('/{config_str}/stream/{type}/{id}.json', stream),
+]
+
+app = Starlette(routes=routes)
@@ -0,0 +1,8 @@
+# Async variant of gunicorn_config.py: same bind, logging and post_fork
+# catalog load / pipeline thread, but each worker runs the Starlette app
+# under uvicorn's event loop.
+#
+#   gunicorn -c gunicorn_asgi_config.py formulio_asgi:app
+from gunicorn_config import *  # noqa: F401,F403
+
+worker_class = 'uvicorn.workers.UvicornWorker'
@@ -1,9 +1,7 @@
 import multiprocessing
 import os
-from threading import Thread
 import logging
 from logging.handlers import RotatingFileHandler
-from formulio_addon import run_scripts_in_loop
 
 # Gunicorn config variables
 bind = "0.0.0.0:8000"
@@ -39,6 +37,8 @@ logger.addHandler(error_handler)
 
 def on_starting(server):
     logger.warning("Gunicorn server is starting")
+    from formulio_addon import reset_metrics_dir
+    reset_metrics_dir()  # worker metric files from a previous run
 
 def on_reload(server):
     logger.warning("Gunicorn server is reloading")
@@ -55,11 +55,11 @@ def worker_abort(worker):
 def post_fork(server, worker):
     logger.warning(f"Worker {worker.pid} forked")
     try:
-        from formulio_addon import load_all_videos
-        load_all_videos()  # populate CATALOG immediately on worker start
-        thread = Thread(target=run_scripts_in_loop, daemon=True)
-        thread.start()
-        logger.warning(f"Background script thread started in worker {worker.pid}")
+        from formulio_addon import start_worker_services
+        # Attach to the shared catalog snapshot (or parse CSVs if none yet);
+        # only the worker holding the pipeline lock runs the scripts.
+        start_worker_services()
+        logger.warning(f"Worker services started in worker {worker.pid}")
     except Exception as e:
         logger.error(f"Failed to start background script in worker {worker.pid}: {str(e)}")
 
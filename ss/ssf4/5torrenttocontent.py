@@ -1,14 +1,19 @@
+import asyncio
 import time
 import os
 import csv
 import glob
 import hashlib
+import heapq
 import struct
 import socket
 import random
+import select
 import signal
 import sys
 import json
+import sqlite3
+import threading
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 
 # ============================================================
@@ -63,6 +68,9 @@ try:
     MAX_PEERS_TO_TRY = CONFIG['peer_settings']['max_peers_to_try']
     TRACKER_TIMEOUT = CONFIG['tracker_settings']['tracker_timeout']
     DHT_TIMEOUT = CONFIG['tracker_settings']['dht_timeout']
+    
+    # get_peers queries in flight at once during a DHT lookup
+    DHT_ALPHA = CONFIG['tracker_settings'].get('dht_alpha', 8)
     VERBOSE = CONFIG['debug']['verbose']
     DEBUG_PEERS = CONFIG['debug']['debug_peers']
     
@@ -74,6 +82,12 @@ try:
     # Falls back to 900s (15 min) if not specified in config
     OVERALL_SCRIPT_TIMEOUT = CONFIG.get('overall_script_timeout', 900)
     
+    # Magnets resolved at the same time, across every row and round directory
+    MAX_CONCURRENT_MAGNETS = CONFIG.get('max_concurrent_magnets', 4)
+    
+    # Peer connections open at once, shared by all magnets in flight
+    MAX_PEER_CONNECTIONS = CONFIG['peer_settings'].get('max_peer_connections', 300)
+    
 except KeyError as e:
     print(f"[ERROR]: Missing required configuration key: {e}")
     print(f"   Please check your info.json file")
@@ -82,9 +96,28 @@ except KeyError as e:
 print(f"[QUALITY] Filter: {quality}")
 print(f"  Will process directories ending with: {quality}")
 print(f"[TIMEOUTS] Per-magnet: {PER_MAGNET_TIMEOUT}s | Overall script: {OVERALL_SCRIPT_TIMEOUT}s")
+print(f"[CONCURRENCY] Magnets: {MAX_CONCURRENT_MAGNETS} | Peer connections: {MAX_PEER_CONNECTIONS}")
 print()
 
-# DHT Bootstrap nodes (kept for DHT discovery)
+# Shared metadata store: every pipeline directory runs its own copy of this
+# script, so it lives next to the sport configs in ../../data by default.
+METADATA_CACHE_PATH = os.path.abspath(os.environ.get(
+    'TORRENT_METADATA_CACHE',
+    CONFIG.get('metadata_cache_path', '../../data/torrent_metadata.sqlite3')
+))
+
+# DHT routing table, shared by all pipelines and kept between runs
+DHT_NODES_PATH = os.path.abspath(os.environ.get(
+    'DHT_NODES_CACHE',
+    CONFIG.get('dht_nodes_path', '../../data/dht_nodes.json')
+))
+
+DHT_K = 8                 # closest nodes that must answer before a lookup ends
+DHT_QUERY_TIMEOUT = 2     # seconds to wait for a single node
+DHT_MAX_FAILURES = 3      # unanswered queries before a node is dropped
+DHT_TABLE_SIZE = 2000     # nodes kept on disk
+
+# DHT Bootstrap nodes, used only while the routing table is (nearly) empty
 DHT_BOOTSTRAP_NODES = [
     ("router.bittorrent.com", 6881),
     ("dht.transmissionbt.com", 6881),
@@ -92,16 +125,16 @@ DHT_BOOTSTRAP_NODES = [
     ("dht.libtorrent.org", 25401),
 ]
 
-peer_stats = {
-    'connect_failed': 0,
-    'connect_timeout': 0,
-    'handshake_failed': 0,
-    'no_extension': 0,
-    'no_metadata_size': 0,
-    'rejected': 0,
-    'timeout_waiting': 0,
-    'success': 0,
-}
+PEER_STAT_KEYS = [
+    'connect_failed',
+    'connect_timeout',
+    'handshake_failed',
+    'no_extension',
+    'no_metadata_size',
+    'rejected',
+    'timeout_waiting',
+    'success',
+]
 
 shutdown_requested = False
 script_start_time = None  # Track when the script started
@@ -236,394 +269,828 @@ def bencode_decode_with_pos(data, pos=0):
         raise ValueError(f"Invalid bencode at position {pos}")
 
 # ============================================================
-# UDP TRACKER
+# METADATA CACHE
 # ============================================================
 
-def get_peers_from_tracker(tracker_url, info_hash):
-    global shutdown_requested
-    if shutdown_requested:
-        return []
+def _metadata_cache_connect():
+    conn = sqlite3.connect(METADATA_CACHE_PATH, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS torrent_metadata ('
+        ' info_hash TEXT PRIMARY KEY,'
+        ' name TEXT NOT NULL,'
+        ' files TEXT NOT NULL,'
+        ' fetched_at REAL NOT NULL)'
+    )
+    return conn
+
+def metadata_cache_get(info_hash):
+    """
+    Look up a previously resolved torrent in the shared store.
+    Returns an info dict with the same name/files layout BEP 9 metadata
+    has (enough for extract_files_with_sizes), or None.
+    """
+    try:
+        conn = _metadata_cache_connect()
+        try:
+            row = conn.execute(
+                'SELECT name, files FROM torrent_metadata WHERE info_hash = ?',
+                (info_hash.hex(),)
+            ).fetchone()
+        finally:
+            conn.close()
+    except Exception as e:
+        log(f"    [CACHE] Lookup failed: {e}")
+        return None
+    
+    if row is None:
+        return None
     
+    name, files = row
+    return {
+        b'name': name.encode('utf-8'),
+        b'files': [
+            {b'path': [p.encode('utf-8') for p in filepath.split('/')], b'length': size}
+            for filepath, size in json.loads(files)
+        ],
+    }
+
+def metadata_cache_put(info_hash, metadata):
+    """Record the file list and sizes of freshly fetched metadata."""
+    try:
+        name = metadata.get(b'name', b'unknown').decode('utf-8', errors='replace')
+        files = json.dumps(extract_files_with_sizes(metadata))
+        conn = _metadata_cache_connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO torrent_metadata (info_hash, name, files, fetched_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (info_hash.hex(), name, files, time.time())
+                )
+        finally:
+            conn.close()
+    except Exception as e:
+        log(f"    [CACHE] Store failed: {e}")
+
+# ============================================================
+# UDP TRACKER
+# ============================================================
+
+UDP_TRACKER_PROTOCOL_ID = 0x41727101980
+CONNECTION_ID_TTL = 60    # seconds a BEP 15 connection ID may be reused
+SCRAPE_BATCH = 70         # info hashes per scrape request (BEP 15 allows ~74)
+
+ACTION_CONNECT, ACTION_ANNOUNCE, ACTION_SCRAPE, ACTION_ERROR = 0, 1, 2, 3
+
+# (tracker url, info hash) -> (seeders, completed, leechers) from scrape_swarms
+swarm_health = {}
+
+def parse_udp_tracker(tracker_url):
     import re
     
     match = re.match(r'udp://([^:/]+):(\d+)', tracker_url)
     if not match:
-        return []
-    
-    host, port = match.group(1), int(match.group(2))
-    
-    try:
-        ip = socket.gethostbyname(host)
-    except:
-        return []
-    
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(TRACKER_TIMEOUT)
-    
-    try:
+        return None
+    return match.group(1), int(match.group(2))
+
+class UDPTrackerClient(asyncio.DatagramProtocol):
+    """
+    BEP 15 client that multiplexes every tracker transaction of every magnet
+    over one UDP socket on the peer-wire event loop. Responses are matched
+    to requests by transaction ID. Tracker DNS lookups are cached for the
+    run; connection IDs, and trackers that did not answer two connects, for
+    CONNECTION_ID_TTL seconds.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}        # transaction id -> future
+        self.addresses = {}      # (host, port) -> task resolving to (ip, port) or None
+        self.connections = {}    # (ip, port) -> (connection id, obtained at)
+        self.connecting = {}     # (ip, port) -> task resolving to a connection id
+        self.unreachable = {}    # (ip, port) -> time a connect went unanswered
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 8:
+            return
+        action, transaction_id = struct.unpack('>II', data[:8])
+        future = self.pending.pop(transaction_id, None)
+        if future is not None and not future.done():
+            future.set_result((action, data))
+
+    def error_received(self, exc):
+        pass
+
+    async def transact(self, addr, packet_for):
+        """Send packet_for(transaction_id) to addr and await (action, response)."""
         transaction_id = random.randint(0, 0xFFFFFFFF)
-        connect_packet = struct.pack('>QII', 0x41727101980, 0, transaction_id)
-        sock.sendto(connect_packet, (ip, port))
-        
-        response = sock.recv(16)
-        action, trans_id, connection_id = struct.unpack('>IIQ', response)
-        
-        if action != 0 or trans_id != transaction_id:
-            return []
+        while transaction_id in self.pending:
+            transaction_id = random.randint(0, 0xFFFFFFFF)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[transaction_id] = future
+        try:
+            self.transport.sendto(packet_for(transaction_id), addr)
+            return await asyncio.wait_for(future, TRACKER_TIMEOUT)
+        finally:
+            self.pending.pop(transaction_id, None)
+
+    async def resolve(self, host, port):
+        key = (host, port)
+        if key not in self.addresses:
+            self.addresses[key] = asyncio.ensure_future(self._resolve(host, port))
+        return await asyncio.shield(self.addresses[key])
+
+    async def _resolve(self, host, port):
+        try:
+            infos = await asyncio.wait_for(asyncio.get_running_loop().getaddrinfo(
+                host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM), TRACKER_TIMEOUT)
+            return infos[0][4][:2]
+        except Exception:
+            return None
+
+    async def connection_id(self, addr):
+        cached = self.connections.get(addr)
+        if cached and time.time() - cached[1] < CONNECTION_ID_TTL:
+            return cached[0]
+        if addr not in self.connecting:
+            self.connecting[addr] = asyncio.ensure_future(self._connect(addr))
+        try:
+            return await asyncio.shield(self.connecting[addr])
+        finally:
+            task = self.connecting.get(addr)
+            if task is not None and task.done():
+                del self.connecting[addr]
+
+    async def _connect(self, addr):
+        # Retransmit once (BEP 15) so a single lost datagram doesn't write
+        # the tracker off for the rest of the run
+        for attempt in range(2):
+            try:
+                action, response = await self.transact(
+                    addr, lambda tid: struct.pack('>QII', UDP_TRACKER_PROTOCOL_ID, ACTION_CONNECT, tid))
+                break
+            except asyncio.TimeoutError:
+                if attempt:
+                    self.unreachable[addr] = time.time()
+                    raise
+        if action != ACTION_CONNECT or len(response) < 16:
+            raise ConnectionError(f"bad connect response from {addr[0]}:{addr[1]}")
+        connection_id = struct.unpack('>Q', response[8:16])[0]
+        self.connections[addr] = (connection_id, time.time())
+        return connection_id
+
+    async def request(self, tracker_url, action, body):
+        """Connect (or reuse a connection ID) and run one announce/scrape transaction."""
+        parsed = parse_udp_tracker(tracker_url)
+        if not parsed:
+            return None
+        addr = await self.resolve(*parsed)
+        if addr is None:
+            return None
+        if time.time() - self.unreachable.get(addr, 0) < CONNECTION_ID_TTL:
+            return None
         
-        transaction_id = random.randint(0, 0xFFFFFFFF)
-        announce_packet = struct.pack(
-            '>QII20s20sQQQIIIiH',
-            connection_id, 1, transaction_id,
+        for attempt in range(2):
+            connection_id = await self.connection_id(addr)
+            got_action, response = await self.transact(
+                addr, lambda tid: struct.pack('>QII', connection_id, action, tid) + body)
+            if got_action == action:
+                return response
+            # An error usually means the cached connection ID expired early
+            self.connections.pop(addr, None)
+        return None
+
+    async def announce(self, tracker_url, info_hash):
+        body = struct.pack(
+            '>20s20sQQQIIIiH',
             info_hash, os.urandom(20),
             0, 0, 0, 0, 0,
             random.randint(0, 0xFFFFFFFF),
             -1, 6881
         )
-        
-        sock.sendto(announce_packet, (ip, port))
-        response = sock.recv(65535)
-        
-        if len(response) < 20:
-            return []
-        
-        action = struct.unpack('>I', response[:4])[0]
-        if action != 1:
-            return []
-        
-        peers = []
-        peer_data = response[20:]
-        for i in range(0, len(peer_data), 6):
-            if shutdown_requested:
+        try:
+            response = await self.request(tracker_url, ACTION_ANNOUNCE, body)
+        except Exception:
+            return set()
+        if not response or len(response) < 20:
+            return set()
+        return parse_compact_peers([response[20:]])
+
+    async def scrape(self, tracker_url, info_hashes):
+        """Returns {info_hash: (seeders, completed, leechers)} for the hashes the tracker answered."""
+        health = {}
+        for i in range(0, len(info_hashes), SCRAPE_BATCH):
+            batch = info_hashes[i:i+SCRAPE_BATCH]
+            try:
+                response = await self.request(tracker_url, ACTION_SCRAPE, b''.join(batch))
+            except Exception:
                 break
-            if i + 6 <= len(peer_data):
-                peer_ip = '.'.join(str(b) for b in peer_data[i:i+4])
-                peer_port = struct.unpack('>H', peer_data[i+4:i+6])[0]
-                if peer_port > 0 and is_public_ip(peer_ip):
-                    peers.append((peer_ip, peer_port))
-        
-        return peers
-        
-    except:
+            if not response:
+                break
+            for n, info_hash in enumerate(batch):
+                offset = 8 + 12 * n
+                if offset + 12 > len(response):
+                    break
+                health[info_hash] = struct.unpack('>III', response[offset:offset+12])
+        return health
+
+_tracker_client = None
+
+async def tracker_client():
+    global _tracker_client
+    if _tracker_client is None:
+        _tracker_client = asyncio.ensure_future(asyncio.get_running_loop().create_datagram_endpoint(
+            UDPTrackerClient, local_addr=('0.0.0.0', 0)))
+    _, protocol = await asyncio.shield(_tracker_client)
+    return protocol
+
+async def finished_within(coros, timeout):
+    """Run coros concurrently; return the results of those done within timeout, cancel the rest."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    if not tasks:
         return []
-    finally:
-        sock.close()
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    return [task.result() if task in done and not task.cancelled() and not task.exception() else None
+            for task in tasks]
+
+async def announce_all(info_hash, tracker_urls, timeout):
+    client = await tracker_client()
+    results = await finished_within((client.announce(t, info_hash) for t in tracker_urls), timeout)
+    peers = set()
+    for result in results:
+        if result:
+            peers.update(result)
+    return peers
+
+async def scrape_all(hashes_by_tracker, timeout):
+    client = await tracker_client()
+    trackers = list(hashes_by_tracker)
+    results = await finished_within((client.scrape(t, hashes_by_tracker[t]) for t in trackers), timeout)
+    return {t: r for t, r in zip(trackers, results) if r}
+
+def run_on_peer_loop(coro, timeout):
+    """Run a coroutine on the shared event loop from a worker thread."""
+    future = asyncio.run_coroutine_threadsafe(coro, peer_event_loop())
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        future.cancel()
+        return None
+
+def scrape_swarms(magnet_links):
+    """
+    Scrape every queued info hash from its trackers in a few multi-hash
+    requests, so announces can skip trackers whose swarm is empty.
+    """
+    hashes_by_tracker = {}
+    for magnet_link in magnet_links:
+        info_hash = extract_info_hash(magnet_link)
+        if not info_hash:
+            continue
+        for tracker_url in extract_trackers(magnet_link):
+            if tracker_url.startswith('udp://'):
+                hashes = hashes_by_tracker.setdefault(tracker_url, [])
+                if info_hash not in hashes:
+                    hashes.append(info_hash)
+    
+    if not hashes_by_tracker:
+        return
+    
+    # DNS, connect with one retransmit, then one round trip per batch
+    batches = max(len(h) + SCRAPE_BATCH - 1 for h in hashes_by_tracker.values()) // SCRAPE_BATCH
+    budget = TRACKER_TIMEOUT * (batches + 3)
+    results = run_on_peer_loop(scrape_all(hashes_by_tracker, budget), budget + 2) or {}
+    
+    for tracker_url, health in results.items():
+        for info_hash, stats in health.items():
+            swarm_health[(tracker_url, info_hash)] = stats
+    
+    alive = {ih for (_, ih), (seeders, _, leechers) in swarm_health.items() if seeders + leechers > 0}
+    scraped = {ih for _, ih in swarm_health}
+    print(f"[SCRAPE] {len(results)}/{len(hashes_by_tracker)} trackers answered - "
+          f"{len(alive)} of {len(scraped)} swarms have peers")
+
+def swarm_alive(tracker_url, info_hash):
+    stats = swarm_health.get((tracker_url, info_hash))
+    return stats is None or stats[0] + stats[2] > 0
 
 # ============================================================
 # DHT
 # ============================================================
 
+def xor_distance(a, b):
+    return int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')
+
+def parse_compact_peers(values):
+    peers = set()
+    for peer_data in values:
+        for i in range(0, len(peer_data) - 5, 6):
+            ip = '.'.join(str(b) for b in peer_data[i:i+4])
+            port = struct.unpack('>H', peer_data[i+4:i+6])[0]
+            if port > 0 and is_public_ip(ip):
+                peers.add((ip, port))
+    return peers
+
+def parse_compact_nodes(nodes_data):
+    nodes = []
+    for i in range(0, len(nodes_data) - 25, 26):
+        node_id = nodes_data[i:i+20]
+        ip = '.'.join(str(b) for b in nodes_data[i+20:i+24])
+        port = struct.unpack('>H', nodes_data[i+24:i+26])[0]
+        if port > 0 and is_public_ip(ip):
+            nodes.append((node_id, (ip, port)))
+    return nodes
+
+class RoutingTable:
+    """
+    DHT nodes that have answered us, with our own node ID, saved to
+    DHT_NODES_PATH so the next magnet (or run, or pipeline) starts next to
+    the target instead of at the bootstrap routers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.node_id = os.urandom(20)
+        self.nodes = {}       # node id -> [ip, port, last_seen, failures]
+        self.by_addr = {}     # (ip, port) -> node id
+        self.bootstrap = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self.node_id = bytes.fromhex(saved['node_id'])
+            for node_id, ip, port, last_seen in saved.get('nodes', []):
+                self.nodes[bytes.fromhex(node_id)] = [ip, port, last_seen, 0]
+                self.by_addr[(ip, port)] = bytes.fromhex(node_id)
+            log(f"    [DHT] Loaded {len(self.nodes)} nodes from {self.path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log(f"    [DHT] Could not load routing table: {e}")
+
+    def save(self):
+        with self.lock:
+            freshest = sorted(self.nodes.items(), key=lambda item: item[1][2], reverse=True)
+            saved = {
+                'node_id': self.node_id.hex(),
+                'nodes': [[node_id.hex(), ip, port, last_seen]
+                          for node_id, (ip, port, last_seen, _) in freshest[:DHT_TABLE_SIZE]],
+            }
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            log(f"    [DHT] Could not save routing table: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def seen(self, node_id, addr):
+        with self.lock:
+            old_id = self.by_addr.get(addr)
+            if old_id is not None and old_id != node_id:
+                self.nodes.pop(old_id, None)
+            self.nodes[node_id] = [addr[0], addr[1], time.time(), 0]
+            self.by_addr[addr] = node_id
+
+    def failed(self, addr):
+        with self.lock:
+            node_id = self.by_addr.get(addr)
+            node = self.nodes.get(node_id)
+            if node is None:
+                return
+            node[3] += 1
+            if node[3] >= DHT_MAX_FAILURES:
+                del self.nodes[node_id]
+                del self.by_addr[addr]
+
+    def closest(self, target, count):
+        with self.lock:
+            items = list(self.nodes.items())
+        nearest = heapq.nsmallest(count, items, key=lambda item: xor_distance(item[0], target))
+        return [(node_id, (ip, port)) for node_id, (ip, port, _, _) in nearest]
+
+    def bootstrap_addrs(self):
+        if self.bootstrap is None:
+            addrs = []
+            for host, port in DHT_BOOTSTRAP_NODES:
+                try:
+                    addrs.append((socket.gethostbyname(host), port))
+                except Exception:
+                    continue
+            self.bootstrap = addrs
+        return self.bootstrap
+
+_routing_table = None
+_routing_table_lock = threading.Lock()
+
+def dht_routing_table():
+    global _routing_table
+    with _routing_table_lock:
+        if _routing_table is None:
+            _routing_table = RoutingTable(DHT_NODES_PATH)
+        return _routing_table
+
 def get_peers_from_dht(info_hash):
+    """
+    Iterative get_peers lookup: keep DHT_ALPHA queries in flight to the
+    closest unqueried nodes (by XOR distance to info_hash), starting from
+    the persistent routing table, until the DHT_K closest known nodes have
+    all been asked or enough peers are found.
+    """
     global shutdown_requested
     if shutdown_requested:
         return []
     
     log(f"    [DHT] Querying...")
     
-    node_id = os.urandom(20)
+    table = dht_routing_table()
     peers = set()
     queried = set()
-    to_query = []
+    candidates = []      # heap of (distance, addr)
+    known = set()
+    answered = {}        # addr -> distance
+    pending = {}         # transaction id -> (addr, sent_at, distance)
+    
+    def add_candidate(node_id, addr):
+        if addr not in known:
+            known.add(addr)
+            heapq.heappush(candidates, (xor_distance(node_id, info_hash), addr))
+    
+    for node_id, addr in table.closest(info_hash, DHT_K * 4):
+        add_candidate(node_id, addr)
+    if len(known) < DHT_K:
+        for addr in table.bootstrap_addrs():
+            if addr not in known:
+                known.add(addr)
+                heapq.heappush(candidates, (1 << 160, addr))
     
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(3)
+    sock.setblocking(False)
     
     try:
-        for host, port in DHT_BOOTSTRAP_NODES:
-            if shutdown_requested:
-                break
-            try:
-                ip = socket.gethostbyname(host)
-                to_query.append((ip, port))
-            except:
-                continue
-        
-        tid = 0
+        tid = random.randint(0, 65535)
         start_time = time.time()
         
-        while to_query and time.time() - start_time < DHT_TIMEOUT and not shutdown_requested:
-            addr = to_query.pop(0)
-            if addr in queried:
-                continue
-            queried.add(addr)
+        while time.time() - start_time < DHT_TIMEOUT and not shutdown_requested:
+            # Fill the window with the closest nodes not asked yet
+            while len(pending) < DHT_ALPHA and candidates:
+                distance, addr = heapq.heappop(candidates)
+                if addr in queried:
+                    continue
+                queried.add(addr)
+                tid = (tid + 1) % 65536
+                msg = bencode({
+                    b't': struct.pack('>H', tid),
+                    b'y': b'q',
+                    b'q': b'get_peers',
+                    b'a': {b'id': table.node_id, b'info_hash': info_hash}
+                })
+                try:
+                    sock.sendto(msg, addr)
+                    pending[tid] = (addr, time.time(), distance)
+                except OSError:
+                    table.failed(addr)
             
-            tid = (tid + 1) % 65536
-            msg = bencode({
-                b't': struct.pack('>H', tid),
-                b'y': b'q',
-                b'q': b'get_peers',
-                b'a': {b'id': node_id, b'info_hash': info_hash}
-            })
+            if not pending:
+                break
             
-            try:
-                sock.sendto(msg, addr)
-                data, _ = sock.recvfrom(65536)
-                response = bencode_decode(data)
+            readable, _, _ = select.select([sock], [], [], 0.2)
+            while readable:
+                try:
+                    data, addr = sock.recvfrom(65536)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    break
+                try:
+                    response = bencode_decode(data)
+                    reply_tid = struct.unpack('>H', response[b't'])[0]
+                except Exception:
+                    continue
+                # Only the queried node's reply settles the query; a stray
+                # packet reusing the transaction ID must not drop it
+                sent = pending.get(reply_tid)
+                if sent is None or sent[0] != addr:
+                    continue
+                del pending[reply_tid]
+                if b'r' not in response:
+                    continue
                 
-                if b'r' in response:
-                    r = response[b'r']
-                    
-                    if b'values' in r:
-                        for peer_data in r[b'values']:
-                            if shutdown_requested:
-                                break
-                            for i in range(0, len(peer_data), 6):
-                                if i + 6 <= len(peer_data):
-                                    ip = '.'.join(str(b) for b in peer_data[i:i+4])
-                                    port = struct.unpack('>H', peer_data[i+4:i+6])[0]
-                                    if port > 0 and is_public_ip(ip):
-                                        peers.add((ip, port))
-                    
-                    if b'nodes' in r:
-                        nodes_data = r[b'nodes']
-                        for i in range(0, len(nodes_data), 26):
-                            if shutdown_requested:
-                                break
-                            if i + 26 <= len(nodes_data):
-                                ip = '.'.join(str(b) for b in nodes_data[i+20:i+24])
-                                port = struct.unpack('>H', nodes_data[i+24:i+26])[0]
-                                if port > 0 and is_public_ip(ip):
-                                    new_addr = (ip, port)
-                                    if new_addr not in queried:
-                                        to_query.append(new_addr)
-            except socket.timeout:
-                continue
-            except:
-                continue
+                r = response[b'r']
+                node_id = r.get(b'id', b'')
+                if len(node_id) == 20:
+                    table.seen(node_id, addr)
+                    answered[addr] = xor_distance(node_id, info_hash)
+                
+                if b'values' in r:
+                    peers.update(parse_compact_peers(r[b'values']))
+                
+                if b'nodes' in r:
+                    for new_id, new_addr in parse_compact_nodes(r[b'nodes']):
+                        add_candidate(new_id, new_addr)
+            
+            now = time.time()
+            for expired in [t for t, (_, sent_at, _) in pending.items() if now - sent_at > DHT_QUERY_TIMEOUT]:
+                table.failed(pending.pop(expired)[0])
             
             if len(peers) >= 50:
                 break
+            
+            # Converged: nothing unasked or unanswered is closer than the K
+            # closest nodes that answered
+            if len(answered) >= DHT_K:
+                kth_closest = heapq.nsmallest(DHT_K, answered.values())[-1]
+                outstanding = [distance for _, _, distance in pending.values()]
+                if candidates:
+                    outstanding.append(candidates[0][0])
+                if not outstanding or min(outstanding) > kth_closest:
+                    break
         
-        log(f"    [DHT] Found {len(peers)} peers (queried {len(queried)} nodes)")
+        log(f"    [DHT] Found {len(peers)} peers (queried {len(queried)} nodes, {len(table.nodes)} in table)")
         return list(peers)
         
     finally:
         sock.close()
+        table.save()
 
 # ============================================================
 # BEP 9 METADATA FETCH
 # ============================================================
 
-metadata_result = None
+METADATA_PIECE_SIZE = 16384
 
-def fetch_metadata_from_peer_sync(info_hash, ip, port):
-    global metadata_result, peer_stats, shutdown_requested
-    
-    if metadata_result is not None or shutdown_requested:
-        return None
-    
-    peer_id_str = f"{ip}:{port}"
-    
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(PEER_CONNECT_TIMEOUT)
-        sock.connect((ip, port))
-        sock.settimeout(PEER_METADATA_TIMEOUT)
-        debug(f"{peer_id_str} - connected")
-    except socket.timeout:
-        peer_stats['connect_timeout'] += 1
-        return None
-    except Exception as e:
-        peer_stats['connect_failed'] += 1
-        return None
-    
-    try:
-        # Handshake
-        pstr = b'BitTorrent protocol'
-        reserved = b'\x00\x00\x00\x00\x00\x10\x00\x01'
-        peer_id = b'-PY0001-' + os.urandom(12)
-        
-        handshake = struct.pack('>B', len(pstr)) + pstr + reserved + info_hash + peer_id
-        sock.sendall(handshake)
-        
-        try:
-            response = sock.recv(68)
-        except:
-            peer_stats['handshake_failed'] += 1
-            return None
-        
-        if len(response) < 68:
-            peer_stats['handshake_failed'] += 1
-            return None
-        
-        if not (response[25] & 0x10):
-            debug(f"{peer_id_str} - no extension support")
-            peer_stats['no_extension'] += 1
-            return None
-        
-        debug(f"{peer_id_str} - supports extensions")
-        
-        # Extension handshake
-        ext_hs = bencode({b'm': {b'ut_metadata': 1}, b'metadata_size': 0})
-        ext_msg = b'\x00' + ext_hs
-        sock.sendall(struct.pack('>IB', len(ext_msg) + 1, 20) + ext_msg)
-        
-        metadata_size = 0
-        peer_ut_metadata = 0
-        metadata_pieces = {}
-        pieces_requested = False
-        
-        start_time = time.time()
-        buffer = b''
+def build_handshake(info_hash):
+    pstr = b'BitTorrent protocol'
+    reserved = b'\x00\x00\x00\x00\x00\x10\x00\x01'
+    peer_id = b'-PY0001-' + os.urandom(12)
+    return struct.pack('>B', len(pstr)) + pstr + reserved + info_hash + peer_id
+
+def build_extension_handshake():
+    ext_hs = bencode({b'm': {b'ut_metadata': 1}, b'metadata_size': 0})
+    ext_msg = b'\x00' + ext_hs
+    return struct.pack('>IB', len(ext_msg) + 1, 20) + ext_msg
+
+def build_metadata_request(peer_ut_metadata, piece):
+    req_payload = bencode({b'msg_type': 0, b'piece': piece})
+    return struct.pack('>IB', len(req_payload) + 2, 20) + bytes([peer_ut_metadata]) + req_payload
+
+class MetadataExchange:
+    """
+    ut_metadata state machine for one peer, after the BitTorrent handshake.
+    feed() takes bytes off the wire and returns bytes to send back; once
+    `done` is set, `result` holds the verified info dict (or None).
+    """
+
+    def __init__(self, info_hash, peer_id_str, peer_stats):
+        self.info_hash = info_hash
+        self.peer_id_str = peer_id_str
+        self.peer_stats = peer_stats
+        self.buffer = bytearray()
+        self.metadata_size = 0
+        self.peer_ut_metadata = 0
+        self.metadata_pieces = {}
+        self.pieces_requested = False
+        self.done = False
+        self.result = None
+
+    @property
+    def num_pieces(self):
+        return (self.metadata_size + METADATA_PIECE_SIZE - 1) // METADATA_PIECE_SIZE
+
+    def finish(self, result=None, stat=None):
+        self.done = True
+        self.result = result
+        if stat:
+            self.peer_stats[stat] += 1
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        out = bytearray()
         
-        while time.time() - start_time < PEER_METADATA_TIMEOUT and not shutdown_requested:
-            if metadata_result is not None:
-                return None
-            
-            try:
-                sock.settimeout(2)
-                data = sock.recv(16384)
-                if not data:
-                    debug(f"{peer_id_str} - connection closed")
-                    break
-                buffer += data
-            except socket.timeout:
+        # Consume whole messages from the front of the reused buffer
+        while len(buffer) >= 4 and not self.done:
+            length = int.from_bytes(buffer[:4], 'big')
+            if length == 0:
+                del buffer[:4]
                 continue
-            except Exception as e:
-                debug(f"{peer_id_str} - recv error: {type(e).__name__}")
+            if length > 1000000:
+                buffer.clear()
+                break
+            if len(buffer) < 4 + length:
                 break
             
-            # Process messages
-            while len(buffer) >= 4:
-                length = struct.unpack('>I', buffer[:4])[0]
-                if length == 0:
-                    buffer = buffer[4:]
-                    continue
-                if length > 1000000:
-                    buffer = b''
-                    break
-                if len(buffer) < 4 + length:
-                    break
+            msg = bytes(buffer[4:4+length])
+            del buffer[:4+length]
+            
+            if msg[0] == 20:
+                out += self.on_extended(msg[1], msg[2:])
+        
+        return bytes(out)
+
+    def on_extended(self, ext_id, payload):
+        peer_id_str = self.peer_id_str
+        
+        if ext_id == 0:  # Extension handshake from peer
+            try:
+                decoded = bencode_decode(payload)
                 
-                msg = buffer[4:4+length]
-                buffer = buffer[4+length:]
+                client = decoded.get(b'v', b'unknown')
+                if isinstance(client, bytes):
+                    client = client.decode('utf-8', errors='replace')
+                debug(f"{peer_id_str} - client: {client}")
                 
-                msg_type = msg[0]
+                self.metadata_size = decoded.get(b'metadata_size', 0)
+                debug(f"{peer_id_str} - metadata_size: {self.metadata_size}")
                 
-                if msg_type != 20:
-                    continue
+                if b'm' in decoded:
+                    self.peer_ut_metadata = decoded[b'm'].get(b'ut_metadata', 0)
+                    debug(f"{peer_id_str} - peer's ut_metadata ID: {self.peer_ut_metadata}")
                 
-                ext_id = msg[1]
-                payload = msg[2:]
+                if self.metadata_size == 0:
+                    debug(f"{peer_id_str} - peer has no metadata!")
+                    self.finish(stat='no_metadata_size')
+                    return b''
                 
-                if ext_id == 0:  # Extension handshake from peer
-                    try:
-                        decoded = bencode_decode(payload)
-                        
-                        client = decoded.get(b'v', b'unknown')
-                        if isinstance(client, bytes):
-                            client = client.decode('utf-8', errors='replace')
-                        debug(f"{peer_id_str} - client: {client}")
-                        
-                        metadata_size = decoded.get(b'metadata_size', 0)
-                        debug(f"{peer_id_str} - metadata_size: {metadata_size}")
-                        
-                        if b'm' in decoded:
-                            peer_ut_metadata = decoded[b'm'].get(b'ut_metadata', 0)
-                            debug(f"{peer_id_str} - peer's ut_metadata ID: {peer_ut_metadata}")
-                        
-                        if metadata_size == 0:
-                            debug(f"{peer_id_str} - peer has no metadata!")
-                            peer_stats['no_metadata_size'] += 1
-                            return None
-                        
-                        if metadata_size > 0 and peer_ut_metadata > 0 and not pieces_requested:
-                            num_pieces = (metadata_size + 16383) // 16384
-                            debug(f"{peer_id_str} - requesting {num_pieces} pieces (using ext_id={peer_ut_metadata})")
-                            
-                            for piece in range(num_pieces):
-                                req_payload = bencode({b'msg_type': 0, b'piece': piece})
-                                full_msg = struct.pack('>IB', len(req_payload) + 2, 20) + bytes([peer_ut_metadata]) + req_payload
-                                sock.sendall(full_msg)
-                            
-                            pieces_requested = True
-                            debug(f"{peer_id_str} - sent all piece requests")
-                            
-                    except Exception as e:
-                        debug(f"{peer_id_str} - ext handshake error: {e}")
+                if self.metadata_size > 0 and self.peer_ut_metadata > 0 and not self.pieces_requested:
+                    debug(f"{peer_id_str} - requesting {self.num_pieces} pieces (using ext_id={self.peer_ut_metadata})")
+                    self.pieces_requested = True
+                    return b''.join(build_metadata_request(self.peer_ut_metadata, piece)
+                                    for piece in range(self.num_pieces))
+                    
+            except Exception as e:
+                debug(f"{peer_id_str} - ext handshake error: {e}")
+        
+        elif ext_id == 1:
+            try:
+                decoded, end_pos = bencode_decode_with_pos(payload)
+                msg_type_inner = decoded.get(b'msg_type', -1)
                 
-                elif ext_id == 1:
-                    try:
-                        decoded, end_pos = bencode_decode_with_pos(payload)
-                        msg_type_inner = decoded.get(b'msg_type', -1)
-                        
-                        if msg_type_inner == 1:  # Data
-                            piece_idx = decoded.get(b'piece', 0)
-                            piece_data = payload[end_pos:]
-                            metadata_pieces[piece_idx] = piece_data
-                            
-                            num_pieces = (metadata_size + 16383) // 16384
-                            debug(f"{peer_id_str} - got piece {piece_idx + 1}/{num_pieces} ({len(piece_data)} bytes)")
-                            
-                            if len(metadata_pieces) == num_pieces:
-                                full = b''.join(metadata_pieces[i] for i in range(num_pieces))
-                                
-                                if hashlib.sha1(full).digest() == info_hash:
-                                    debug(f"{peer_id_str} - [VERIFIED] METADATA!")
-                                    peer_stats['success'] += 1
-                                    return bencode_decode(full)
-                                else:
-                                    debug(f"{peer_id_str} - hash mismatch!")
+                if msg_type_inner == 1:  # Data
+                    piece_idx = decoded.get(b'piece', 0)
+                    piece_data = payload[end_pos:]
+                    self.metadata_pieces[piece_idx] = piece_data
+                    
+                    num_pieces = self.num_pieces
+                    debug(f"{peer_id_str} - got piece {piece_idx + 1}/{num_pieces} ({len(piece_data)} bytes)")
+                    
+                    if len(self.metadata_pieces) == num_pieces:
+                        full = b''.join(self.metadata_pieces[i] for i in range(num_pieces))
                         
-                        elif msg_type_inner == 2:  # Reject
-                            debug(f"{peer_id_str} - REJECTED")
-                            peer_stats['rejected'] += 1
-                            return None
-                            
-                    except Exception as e:
-                        debug(f"{peer_id_str} - metadata parse error: {e}")
+                        if hashlib.sha1(full).digest() == self.info_hash:
+                            debug(f"{peer_id_str} - [VERIFIED] METADATA!")
+                            self.finish(bencode_decode(full), 'success')
+                        else:
+                            debug(f"{peer_id_str} - hash mismatch!")
+                            self.finish()
+                
+                elif msg_type_inner == 2:  # Reject
+                    debug(f"{peer_id_str} - REJECTED")
+                    self.finish(stat='rejected')
+                    
+            except Exception as e:
+                debug(f"{peer_id_str} - metadata parse error: {e}")
         
-        debug(f"{peer_id_str} - timeout (got {len(metadata_pieces)}/{(metadata_size + 16383) // 16384 if metadata_size else '?'} pieces)")
-        peer_stats['timeout_waiting'] += 1
+        return b''
+
+async def exchange_metadata(reader, writer, info_hash, peer_id_str, peer_stats):
+    writer.write(build_handshake(info_hash))
+    await writer.drain()
+    
+    try:
+        response = await asyncio.wait_for(reader.readexactly(68), PEER_METADATA_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, OSError):
+        peer_stats['handshake_failed'] += 1
         return None
+    
+    if not (response[25] & 0x10):
+        debug(f"{peer_id_str} - no extension support")
+        peer_stats['no_extension'] += 1
+        return None
+    
+    debug(f"{peer_id_str} - supports extensions")
+    
+    writer.write(build_extension_handshake())
+    await writer.drain()
+    
+    exchange = MetadataExchange(info_hash, peer_id_str, peer_stats)
+    while not exchange.done:
+        data = await reader.read(65536)
+        if not data:
+            debug(f"{peer_id_str} - connection closed")
+            break
+        reply = exchange.feed(data)
+        if reply:
+            writer.write(reply)
+            await writer.drain()
+    
+    if not exchange.done:
+        peer_stats['timeout_waiting'] += 1
+    return exchange.result
+
+async def fetch_metadata_from_peer(info_hash, ip, port, peer_stats):
+    peer_id_str = f"{ip}:{port}"
+    
+    async with _peer_slots:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), PEER_CONNECT_TIMEOUT)
+            debug(f"{peer_id_str} - connected")
+        except asyncio.TimeoutError:
+            peer_stats['connect_timeout'] += 1
+            return None
+        except Exception:
+            peer_stats['connect_failed'] += 1
+            return None
         
-    except Exception as e:
-        debug(f"{peer_id_str} - error: {e}")
+        try:
+            return await asyncio.wait_for(
+                exchange_metadata(reader, writer, info_hash, peer_id_str, peer_stats),
+                PEER_METADATA_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            debug(f"{peer_id_str} - timeout")
+            peer_stats['timeout_waiting'] += 1
+            return None
+        except Exception as e:
+            debug(f"{peer_id_str} - error: {e}")
+            return None
+        finally:
+            writer.close()
+
+async def fetch_metadata_async(info_hash, peers, peer_stats):
+    """Race every peer at once; the first verified metadata wins and the rest are cancelled."""
+    tasks = [asyncio.ensure_future(fetch_metadata_from_peer(info_hash, ip, port, peer_stats))
+             for ip, port in peers]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result is not None:
+                return result
         return None
     finally:
-        sock.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-def fetch_metadata_parallel(info_hash, peers):
-    global metadata_result, peer_stats, shutdown_requested
-    
+# One event loop on a daemon thread carries the peer connections and tracker
+# transactions of every magnet in flight, so MAX_PEER_CONNECTIONS is a
+# single global budget and all trackers share one UDP socket.
+_peer_loop = None
+_peer_loop_lock = threading.Lock()
+_peer_slots = None
+
+def peer_event_loop():
+    global _peer_loop, _peer_slots
+    with _peer_loop_lock:
+        if _peer_loop is None:
+            loop = asyncio.new_event_loop()
+            _peer_slots = asyncio.Semaphore(MAX_PEER_CONNECTIONS)
+            threading.Thread(target=loop.run_forever, name='peer-wire', daemon=True).start()
+            _peer_loop = loop
+        return _peer_loop
+
+def fetch_metadata_parallel(info_hash, peers, cancel=None):
     if shutdown_requested:
         return None
     
-    metadata_result = None
-    
-    for key in peer_stats:
-        peer_stats[key] = 0
-    
     if not peers:
         return None
     
+    peer_stats = dict.fromkeys(PEER_STAT_KEYS, 0)
+    
     peers = list(peers)
     random.shuffle(peers)
     peers = peers[:MAX_PEERS_TO_TRY]
     
-    log(f"    Trying {len(peers)} peers (20 parallel)...")
+    log(f"    Trying {len(peers)} peers (all at once)...")
     
-    def worker(peer):
-        global metadata_result, shutdown_requested
-        if metadata_result is not None or shutdown_requested:
-            return None
-        result = fetch_metadata_from_peer_sync(info_hash, peer[0], peer[1])
-        if result is not None:
-            metadata_result = result
-        return result
-    
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = [executor.submit(worker, peer) for peer in peers]
-        
-        for future in futures:
-            if shutdown_requested:
-                break
-            try:
-                future.result(timeout=PEER_METADATA_TIMEOUT + 5)
-            except:
-                pass
-            if metadata_result is not None:
+    future = asyncio.run_coroutine_threadsafe(
+        fetch_metadata_async(info_hash, peers, peer_stats), peer_event_loop()
+    )
+    metadata = None
+    while True:
+        try:
+            metadata = future.result(timeout=1)
+            break
+        except FuturesTimeoutError:
+            if shutdown_requested or (cancel is not None and cancel.is_set()):
+                future.cancel()
                 break
+        except Exception:
+            break
     
     log(f"\n    === Stats ===")
     log(f"    Connect fail/timeout: {peer_stats['connect_failed']}/{peer_stats['connect_timeout']}")
@@ -631,7 +1098,7 @@ def fetch_metadata_parallel(info_hash, peers):
     log(f"    Rejected/Timeout: {peer_stats['rejected']}/{peer_stats['timeout_waiting']}")
     log(f"    Success: {peer_stats['success']}")
     
-    return metadata_result
+    return metadata
 
 # ============================================================
 # MAIN
@@ -645,19 +1112,16 @@ def get_all_peers(info_hash, trackers):
     all_peers = set()
     
     udp_trackers = [t for t in trackers if 'udp://' in t]
-    log(f"    [TRACKERS] Querying {len(udp_trackers)} trackers...")
+    live_trackers = [t for t in udp_trackers if swarm_alive(t, info_hash)]
+    if len(live_trackers) < len(udp_trackers):
+        log(f"    [TRACKERS] Skipping {len(udp_trackers) - len(live_trackers)} trackers with an empty swarm")
+    log(f"    [TRACKERS] Querying {len(live_trackers)} trackers...")
     
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(get_peers_from_tracker, t, info_hash) for t in udp_trackers]
-        for future in futures:
-            if shutdown_requested:
-                break
-            try:
-                result = future.result(timeout=TRACKER_TIMEOUT + 2)
-                if result:
-                    all_peers.update(result)
-            except:
-                pass
+    if live_trackers:
+        # DNS, connect with one retransmit (unless the connection ID is
+        # cached) plus announce; slow trackers are dropped, not waited for
+        budget = TRACKER_TIMEOUT * 4
+        all_peers.update(run_on_peer_loop(announce_all(info_hash, live_trackers, budget), budget + 2) or ())
     
     log(f"    [TRACKERS] Found {len(all_peers)} peers")
     
@@ -667,7 +1131,7 @@ def get_all_peers(info_hash, trackers):
     
     return list(all_peers)
 
-def magnet_to_torrent_info(magnet_uri):
+def magnet_to_torrent_info(magnet_uri, cancel=None):
     global shutdown_requested
     if shutdown_requested:
         return None
@@ -679,6 +1143,11 @@ def magnet_to_torrent_info(magnet_uri):
     
     print(f"  Info hash: {info_hash.hex().upper()}")
     
+    cached = metadata_cache_get(info_hash)
+    if cached is not None:
+        print(f"  [CACHED] Metadata from shared store")
+        return cached
+    
     trackers = extract_trackers(magnet_uri)
     
     if not trackers:
@@ -687,7 +1156,7 @@ def magnet_to_torrent_info(magnet_uri):
     
     peers = get_all_peers(info_hash, trackers)
     
-    if shutdown_requested:
+    if shutdown_requested or (cancel is not None and cancel.is_set()):
         return None
     
     log(f"    Total: {len(peers)} unique peers")
@@ -695,26 +1164,70 @@ def magnet_to_torrent_info(magnet_uri):
     if not peers:
         return None
     
-    metadata = fetch_metadata_parallel(info_hash, peers)
+    metadata = fetch_metadata_parallel(info_hash, peers, cancel)
+    if metadata is not None:
+        metadata_cache_put(info_hash, metadata)
     return metadata
 
 def resolve_magnet_with_timeout(magnet_link, timeout_seconds):
     """
     Resolve a single magnet link with a hard timeout.
     Uses a thread pool to enforce the timeout — if the resolution
-    takes longer than timeout_seconds, we give up on this magnet.
+    takes longer than timeout_seconds, we give up on this magnet and
+    tell its peer workers to stop.
     Returns metadata dict or None.
     """
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(magnet_to_torrent_info, magnet_link)
+    cancel = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(magnet_to_torrent_info, magnet_link, cancel)
+    try:
+        return future.result(timeout=timeout_seconds)
+    except FuturesTimeoutError:
+        print(f"  [SKIPPED] Magnet timed out after {timeout_seconds}s — moving on")
+        return None
+    except Exception as e:
+        print(f"  [SKIPPED] Magnet error: {e}")
+        return None
+    finally:
+        cancel.set()
+        executor.shutdown(wait=False)
+
+def resolve_magnet_timed(magnet_link):
+    """Resolver pool task: returns (metadata or None, seconds spent)."""
+    start_time = time.time()
+    metadata = resolve_magnet_with_timeout(magnet_link, PER_MAGNET_TIMEOUT)
+    return metadata, time.time() - start_time
+
+def wait_for_magnet(future):
+    """Wait for a queued magnet, giving up on shutdown or the overall timeout."""
+    while not (shutdown_requested or check_overall_timeout()):
         try:
-            return future.result(timeout=timeout_seconds)
+            return future.result(timeout=1)
         except FuturesTimeoutError:
-            print(f"  [SKIPPED] Magnet timed out after {timeout_seconds}s — moving on")
-            return None
-        except Exception as e:
-            print(f"  [SKIPPED] Magnet error: {e}")
-            return None
+            continue
+    return None, 0.0
+
+def magnet_key(magnet_link):
+    info_hash = extract_info_hash(magnet_link)
+    return info_hash if info_hash else magnet_link
+
+def read_magnet_rows(csv_file):
+    """Parse a round CSV into (line_num, torrent_name, infohash, magnet_link) rows."""
+    rows = []
+    with open(csv_file, 'r', encoding='utf-8') as file:
+        for line_num, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            
+            parts = line.rsplit(',', 2)
+            if len(parts) != 3:
+                print(f"  [FAILED] {csv_file} line {line_num}: Incorrect format")
+                continue
+            
+            torrent_name, infohash, magnet_link = (p.strip() for p in parts)
+            rows.append((line_num, torrent_name, infohash, magnet_link))
+    return rows
 
 def extract_files_with_sizes(metadata):
     files = []
@@ -783,16 +1296,30 @@ def process_csv_files():
     magnets_resolved = 0
     magnets_failed = 0
     
+    csv_jobs = []
     for subdir in matching_dirs:
-        if shutdown_requested or check_overall_timeout():
-            print("\n[WARNING] Shutdown/timeout requested - stopping processing")
-            break
-        
-        csv_files = sorted(glob.glob(os.path.join(subdir, '*.csv')))
-        
-        for csv_file in csv_files:
+        for csv_file in sorted(glob.glob(os.path.join(subdir, '*.csv'))):
+            csv_jobs.append((subdir, csv_file, read_magnet_rows(csv_file)))
+    
+    scrape_swarms([magnet_link for _, _, rows in csv_jobs for _, _, _, magnet_link in rows])
+    
+    # Queue every magnet up front so slow torrents in one round don't hold up
+    # the rest; results are still written and archived per CSV, in order.
+    executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_MAGNETS)
+    futures = {}
+    for _, _, rows in csv_jobs:
+        for _, _, _, magnet_link in rows:
+            key = magnet_key(magnet_link)
+            if key not in futures:
+                futures[key] = executor.submit(resolve_magnet_timed, magnet_link)
+    
+    if futures:
+        print(f"[RESOLVER] {len(futures)} magnets queued from {len(csv_jobs)} CSV file(s)")
+    
+    try:
+        for subdir, csv_file, rows in csv_jobs:
             if shutdown_requested or check_overall_timeout():
-                print("\n[WARNING] Shutdown/timeout requested - stopping current file")
+                print("\n[WARNING] Shutdown/timeout requested - stopping processing")
                 break
             
             print(f"\n{'='*60}")
@@ -805,44 +1332,19 @@ def process_csv_files():
             
             all_magnets_successful = True
             
-            with open(csv_file, 'r', encoding='utf-8') as file, \
-                 open(content_file_path, 'a', newline='', encoding='utf-8') as content_file:
-                
+            with open(content_file_path, 'a', newline='', encoding='utf-8') as content_file:
                 content_writer = csv.writer(content_file)
                 
-                for line_num, line in enumerate(file, 1):
+                for line_num, torrent_name, infohash, magnet_link in rows:
+                    metadata, elapsed = wait_for_magnet(futures[magnet_key(magnet_link)])
+                    
                     if shutdown_requested or check_overall_timeout():
                         print("\n[WARNING] Shutdown/timeout requested - stopping current file")
                         all_magnets_successful = False
                         break
                     
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    parts = line.rsplit(',', 2)
-                    if len(parts) != 3:
-                        print(f"  [FAILED] Line {line_num}: Incorrect format")
-                        continue
-                    
-                    torrent_name, infohash, magnet_link = parts
-                    torrent_name = torrent_name.strip()
-                    infohash = infohash.strip()
-                    magnet_link = magnet_link.strip()
-
                     print(f"\n[{line_num}] {torrent_name[:55]}...")
                     
-                    start_time = time.time()
-                    
-                    # Use per-magnet timeout to skip slow magnets
-                    metadata = resolve_magnet_with_timeout(magnet_link, PER_MAGNET_TIMEOUT)
-                    
-                    elapsed = time.time() - start_time
-                    
-                    if shutdown_requested or check_overall_timeout():
-                        all_magnets_successful = False
-                        break
-                    
                     if metadata is None:
                         all_magnets_successful = False
                         if elapsed >= PER_MAGNET_TIMEOUT - 1:
@@ -874,6 +1376,8 @@ def process_csv_files():
                 print(f'\n[SUCCESS] Archived: {csv_file}')
             else:
                 print(f'\n[PARTIAL] Not archiving {csv_file} - some magnets failed/skipped')
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
     
     # Print summary
     total_time = time.time() - script_start_time